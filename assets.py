@@ -0,0 +1,151 @@
+"""
+A shared cache of the images in the assets folder. Each file is decoded
+once per process, converted to the display's pixel format, and each size
+it is drawn at is scaled once. Scaled copies are dropped when the window
+is resized, as the sizes they were made for no longer apply.
+
+The 12 piece images are packed into one sprite sheet, pieces.png: a row
+per color and a column per piece type, in the order of the type codes in
+pieces.py. Run this file to rebuild it after changing a piece image.
+"""
+import os
+import sys
+
+import pygame
+
+from pieces import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+
+ASSET_DIR = "assets"
+BOARD_IMAGE = "chess_board.png"
+ATLAS_IMAGE = "pieces.png"
+SPRITE_SIZE = 100  # pixels per piece in the atlas
+COLORS = {"W": "white", "B": "black"}
+KINDS = {PAWN: "pawn", KNIGHT: "knight", BISHOP: "bishop", ROOK: "rook",
+         QUEEN: "queen", KING: "king"}
+
+_images = {}
+_scaled = {}
+_sprites = {}  # (color, kind, size) -> subsurface of the scaled atlas
+
+
+def load_image(name):
+    """
+    returns an image from the assets folder, loading it on first use.
+    Once a display mode is set, images are converted to its pixel format
+    so blits don't convert them again every frame.
+    :param name: file name, ex. 'white_king.png'
+    :return: pygame.Surface. Callers must not draw on it, as it is shared
+    """
+    image = _images.get(name)
+    if image is None:
+        image = pygame.image.load(os.path.join(ASSET_DIR, name))
+        if pygame.display.get_surface() is not None:
+            image = image.convert_alpha()
+        _images[name] = image
+    return image
+
+
+def preload():
+    """
+    decodes the board and the piece atlas up front. Call after
+    pygame.display.set_mode, so they are converted to the display's format
+    :return: nothing
+    """
+    load_image(BOARD_IMAGE)
+    load_atlas()
+
+
+def sprite_rect(color, kind, size=SPRITE_SIZE):
+    """
+    finds a piece in the atlas
+    :param color: 'W' or 'B'
+    :param kind: piece type code, ex. KING
+    :param size: the size pieces are scaled to
+    :return: pygame.Rect within an atlas scaled to that size
+    """
+    return pygame.Rect(kind * size, (color == "B") * size, size, size)
+
+
+def make_atlas():
+    """
+    packs the 12 piece images into one surface
+    :return: pygame.Surface
+    """
+    atlas = pygame.Surface((len(KINDS) * SPRITE_SIZE,
+                            len(COLORS) * SPRITE_SIZE), pygame.SRCALPHA)
+    for color, color_name in COLORS.items():
+        for kind, kind_name in KINDS.items():
+            image = pygame.image.load(
+                os.path.join(ASSET_DIR, f"{color_name}_{kind_name}.png"))
+            atlas.blit(image, sprite_rect(color, kind))
+    return atlas
+
+
+def load_atlas():
+    """
+    returns the piece atlas, loading it on first use. If pieces.png is
+    missing it is built from the separate images instead
+    :return: pygame.Surface. Callers must not draw on it, as it is shared
+    """
+    atlas = _images.get(ATLAS_IMAGE)
+    if atlas is None:
+        if os.path.exists(os.path.join(ASSET_DIR, ATLAS_IMAGE)):
+            return load_image(ATLAS_IMAGE)
+        atlas = make_atlas()
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        _images[ATLAS_IMAGE] = atlas
+    return atlas
+
+
+def piece_image(color, kind, size):
+    """
+    returns a piece's sprite at a size. The whole atlas is scaled once per
+    size, and each piece is a subsurface of it, so nothing is copied
+    :param color: 'W' or 'B'
+    :param kind: piece type code, ex. KING
+    :param size: width and height in pixels
+    :return: pygame.Surface. Callers must not draw on it, as it is shared
+    """
+    key = (color, kind, size)
+    sprite = _sprites.get(key)
+    if sprite is None:
+        load_atlas()
+        atlas = scaled(ATLAS_IMAGE, (len(KINDS) * size, len(COLORS) * size))
+        sprite = _sprites[key] = atlas.subsurface(
+            sprite_rect(color, kind, size))
+    return sprite
+
+
+def scaled(name, size):
+    """
+    returns an image scaled to a size, scaling it on first use
+    :param name: file name, ex. 'white_king.png'
+    :param size: (width, height) in pixels
+    :return: pygame.Surface. Callers must not draw on it, as it is shared
+    """
+    key = (name, tuple(size))
+    image = _scaled.get(key)
+    if image is None:
+        image = _scaled[key] = pygame.transform.scale(load_image(name), size)
+    return image
+
+
+def invalidate():
+    """drops the scaled images, ex. when the window is resized"""
+    _scaled.clear()
+    _sprites.clear()
+
+
+def clear():
+    """empties the cache"""
+    _images.clear()
+    _scaled.clear()
+    _sprites.clear()
+
+
+if __name__ == "__main__":
+    path = os.path.join(ASSET_DIR, ATLAS_IMAGE)
+    pygame.image.save(make_atlas(), path)
+    print(f"Wrote {path}")
+    sys.exit()
@@ -0,0 +1,363 @@
+"""
+A 64-bit bitboard move generator for Chess.
+Squares are numbered 0-63 from a1 to h8, so bit (file + 8 * rank) is set
+when that square is occupied. Attack masks are built at import time from
+the square tables in board.py. Besides moves, the board answers attack,
+check and pin questions from its masks, so Chess never walks the square
+index for them.
+"""
+from board import (Board, SQUARES, ORTHOGONAL, DIAGONAL, KNIGHT_TARGETS,
+                   KING_TARGETS, NEARBY, PAWN_PUSHES, PAWN_CAPTURES,
+                   RAYS as SQUARE_RAYS)
+from pieces import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+
+SQUARE_NAMES = SQUARES
+SQUARE_INDEX = {name: i for i, name in enumerate(SQUARE_NAMES)}
+
+
+def _mask(squares):
+    """
+    converts square names to a bitmask
+    :param squares: iterable of square strings
+    :return: int bitmask
+    """
+    mask = 0
+    for square in squares:
+        mask |= 1 << SQUARE_INDEX[square]
+    return mask
+
+
+# the square tables from board.py, as one mask per square
+KNIGHT_ATTACKS = tuple(_mask(KNIGHT_TARGETS[sq]) for sq in SQUARE_NAMES)
+KING_ATTACKS = tuple(_mask(KING_TARGETS[sq]) for sq in SQUARE_NAMES)
+NEARBY_MASKS = tuple(_mask(NEARBY[sq]) for sq in SQUARE_NAMES)
+# color -> per square mask of the squares a pawn there attacks
+PAWN_ATTACKS = {color: tuple(_mask(PAWN_CAPTURES[color][sq])
+                             for sq in SQUARE_NAMES)
+                for color in ('W', 'B')}
+# color -> per square mask of a pawn's single and double step
+PAWN_SINGLE = {color: tuple(_mask(PAWN_PUSHES[color][sq][:1])
+                            for sq in SQUARE_NAMES)
+               for color in ('W', 'B')}
+PAWN_DOUBLE = {color: tuple(_mask(PAWN_PUSHES[color][sq][1:])
+                            for sq in SQUARE_NAMES)
+               for color in ('W', 'B')}
+RAYS = {step: tuple(_mask(SQUARE_RAYS[step][sq]) for sq in SQUARE_NAMES)
+        for step in ORTHOGONAL + DIAGONAL}
+# a ray heads towards higher square numbers if it moves up a rank,
+# or stays on the rank and moves right
+ASCENDING = {step: step[1] > 0 or (step[1] == 0 and step[0] > 0)
+             for step in RAYS}
+# the (ray masks, ascending) pairs each kind of slider moves along
+STRAIGHT_LINES = tuple((RAYS[step], ASCENDING[step]) for step in ORTHOGONAL)
+DIAGONAL_LINES = tuple((RAYS[step], ASCENDING[step]) for step in DIAGONAL)
+SLIDER_LINES = {ROOK: STRAIGHT_LINES, BISHOP: DIAGONAL_LINES,
+                QUEEN: STRAIGHT_LINES + DIAGONAL_LINES}
+
+
+def slider_attacks(index, occupied, lines):
+    """
+    finds all squares a sliding piece reaches, stopping at the first blocker
+    :param index: origination square, 0-63
+    :param occupied: bitmask of all occupied squares
+    :param lines: the directions the piece slides in, ex. STRAIGHT_LINES
+    :return: int bitmask, including the blocking squares
+    """
+    attacks = 0
+    for rays, ascending in lines:
+        ray = rays[index]
+        blockers = ray & occupied
+        if blockers:
+            if ascending:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= rays[first]
+        attacks |= ray
+    return attacks
+
+
+def _nearest(blockers, step):
+    """
+    finds the blocker closest to the start of a ray
+    :param blockers: bitmask of the occupied squares on the ray
+    :param step: the ray's direction
+    :return: square index, 0-63
+    """
+    if ASCENDING[step]:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+
+def iter_squares(mask):
+    """
+    yields the square names of every set bit in a mask
+    :param mask: int bitmask
+    :return: generator of square strings
+    """
+    while mask:
+        low = mask & -mask
+        yield SQUARE_NAMES[low.bit_length() - 1]
+        mask ^= low
+
+
+def square_list(mask):
+    """
+    lists the square names of every set bit in a mask
+    :param mask: int bitmask
+    :return: list of square strings, from a1 to h8
+    """
+    squares = []
+    while mask:
+        low = mask & -mask
+        squares.append(SQUARE_NAMES[low.bit_length() - 1])
+        mask ^= low
+    return squares
+
+
+class BitboardBoard(Board):
+    """
+    A Board that also tracks occupancy per color and per piece type as
+    64-bit masks
+    """
+    def __init__(self):
+        """initialize the square index and empty occupancy masks"""
+        super().__init__()
+        self._occupied = {'W': 0, 'B': 0}
+        self._types = [0] * 6  # piece type code -> mask, both colors
+
+    def relocate(self, piece, old, new):
+        """
+        keeps the square index and occupancy masks in sync
+        :param piece: the piece object being moved
+        :param old: the square the piece is leaving, or None
+        :param new: the square the piece is entering, or None if captured
+        :return: nothing
+        """
+        color = piece.get_color()
+        types = self._types
+        if old is not None and self._squares.get(old) is piece:
+            bit = 1 << SQUARE_INDEX[old]
+            self._occupied[color] &= ~bit
+            types[piece.TYPE] &= ~bit
+        if new is not None:
+            bit = 1 << SQUARE_INDEX[new]
+            displaced = self._squares.get(new)
+            if displaced is not None and displaced is not piece:
+                self._occupied[displaced.get_color()] &= ~bit
+                types[displaced.TYPE] &= ~bit
+            self._occupied[color] |= bit
+            types[piece.TYPE] |= bit
+        super().relocate(piece, old, new)
+
+    def clear(self):
+        """empties the square index and occupancy masks"""
+        super().clear()
+        self._occupied = {'W': 0, 'B': 0}
+        self._types = [0] * 6
+
+    def get_occupied(self, color=None):
+        """
+        returns an occupancy mask
+        :param color: 'W', 'B', or None for both colors
+        :return: int bitmask
+        """
+        if color is None:
+            return self._occupied['W'] | self._occupied['B']
+        return self._occupied[color]
+
+    def move_mask(self, piece):
+        """
+        finds every destination of a piece as a bitmask
+        :param piece: an uncaptured piece object on this board
+        :return: int bitmask of valid destinations
+        """
+        index = SQUARE_INDEX[piece.get_position()]
+        color = piece.get_color()
+        occupied_by = self._occupied
+        piece_type = piece.TYPE
+
+        if piece_type == PAWN:
+            return self._pawn_mask(index, color, piece.get_has_moved(),
+                                   occupied_by['W'] | occupied_by['B'])
+        if piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[index] & ~occupied_by[color]
+        if piece_type == KING:
+            return KING_ATTACKS[index] & ~occupied_by[color]
+        return (slider_attacks(index, occupied_by['W'] | occupied_by['B'],
+                               SLIDER_LINES[piece_type])
+                & ~occupied_by[color])
+
+    def _pawn_mask(self, index, color, has_moved, occupied):
+        """
+        finds pawn pushes and captures as a bitmask
+        :param index: origination square, 0-63
+        :param color: 'W' or 'B'
+        :param has_moved: whether the pawn has moved
+        :param occupied: bitmask of all occupied squares
+        :return: int bitmask of valid destinations
+        """
+        mask = 0
+        single = PAWN_SINGLE[color][index]
+        if single and not single & occupied:
+            mask = single
+            double = PAWN_DOUBLE[color][index]
+            if not has_moved and double and not double & occupied:
+                mask |= double
+        enemy = self._occupied['B' if color == 'W' else 'W']
+        return mask | (PAWN_ATTACKS[color][index] & enemy)
+
+    def legal_moves(self, piece):
+        """
+        finds every destination of a piece as square strings
+        :param piece: an uncaptured piece object on this board
+        :return: list of valid destinations, ex. ['e3', 'e4']
+        """
+        return square_list(self.move_mask(piece))
+
+    def moves_and_targets(self, piece):
+        """
+        finds a piece's destinations and, among them, its captures
+        :param piece: an uncaptured piece object on this board
+        :return: tuple of two lists of square strings
+        """
+        mask = self.move_mask(piece)
+        enemy = self._occupied['B' if piece.get_color() == 'W' else 'W']
+        return square_list(mask), square_list(mask & enemy)
+
+    def attackers(self, index, by_color, occupied=None):
+        """
+        finds a player's pieces that attack a square
+        :param index: the square, 0-63
+        :param by_color: the attacking player, 'W' or 'B'
+        :param occupied: optional occupancy to slide through instead of
+        the board's, ex. without the defending king
+        :return: int bitmask of the attackers' squares
+        """
+        types = self._types
+        if occupied is None:
+            occupied = self._occupied['W'] | self._occupied['B']
+        defender = 'B' if by_color == 'W' else 'W'
+        found = ((KNIGHT_ATTACKS[index] & types[KNIGHT])
+                 | (KING_ATTACKS[index] & types[KING])
+                 | (PAWN_ATTACKS[defender][index] & types[PAWN]))
+        straight = types[ROOK] | types[QUEEN]
+        if straight:
+            found |= slider_attacks(index, occupied,
+                                    STRAIGHT_LINES) & straight
+        diagonal = types[BISHOP] | types[QUEEN]
+        if diagonal:
+            found |= slider_attacks(index, occupied,
+                                    DIAGONAL_LINES) & diagonal
+        return found & self._occupied[by_color]
+
+    def attack_mask(self, color, ignore=None):
+        """
+        finds every square a player's pieces attack
+        :param color: the attacking player, 'W' or 'B'
+        :param ignore: a piece to treat as absent, so that sliders attack
+        the squares behind it. Used for the defending king
+        :return: int bitmask
+        """
+        occupied = self._occupied['W'] | self._occupied['B']
+        if ignore is not None and ignore.get_position() is not None:
+            occupied &= ~(1 << SQUARE_INDEX[ignore.get_position()])
+        own = self._occupied[color]
+        types = self._types
+        attacked = 0
+        for piece_type, table in ((PAWN, PAWN_ATTACKS[color]),
+                                  (KNIGHT, KNIGHT_ATTACKS),
+                                  (KING, KING_ATTACKS)):
+            mask = types[piece_type] & own
+            while mask:
+                low = mask & -mask
+                attacked |= table[low.bit_length() - 1]
+                mask ^= low
+        for piece_type in (ROOK, BISHOP, QUEEN):
+            mask = types[piece_type] & own
+            while mask:
+                low = mask & -mask
+                attacked |= slider_attacks(low.bit_length() - 1, occupied,
+                                           SLIDER_LINES[piece_type])
+                mask ^= low
+        return attacked
+
+    def checkers(self, king):
+        """
+        finds the opposing pieces that attack a king
+        :param king: the king piece object, on this board
+        :return: list of (square, path) pairs, where path lists the squares
+        between a sliding checker and the king
+        """
+        index = SQUARE_INDEX[king.get_position()]
+        enemy = 'B' if king.get_color() == 'W' else 'W'
+        found = []
+        for square in iter_squares(self.attackers(index, enemy)):
+            checker = SQUARE_INDEX[square]
+            path = ()
+            for ray in RAYS.values():
+                if ray[index] >> checker & 1:
+                    between = ray[index] ^ ray[checker]
+                    path = tuple(iter_squares(between & ~(1 << checker)))
+                    break
+            found.append((square, path))
+        return found
+
+    def pins(self, king):
+        """
+        finds a king's pieces that cannot leave the line between it and an
+        opposing slider
+        :param king: the king piece object, on this board
+        :return: dict of pinned square -> set of squares it may move to
+        """
+        index = SQUARE_INDEX[king.get_position()]
+        color = king.get_color()
+        own = self._occupied[color]
+        enemy = self._occupied['B' if color == 'W' else 'W']
+        occupied = own | enemy
+        types = self._types
+        pins = {}
+        for step, ray in RAYS.items():
+            blockers = ray[index] & occupied
+            if not blockers & own:
+                continue
+            slider = ROOK if step in ORTHOGONAL else BISHOP
+            pinners = (types[slider] | types[QUEEN]) & enemy
+            if not ray[index] & pinners:
+                continue
+            first = _nearest(blockers, step)
+            if not (1 << first) & own:
+                continue
+            rest = blockers & ~(1 << first)
+            if not rest:
+                continue
+            second = _nearest(rest, step)
+            if (1 << second) & pinners:
+                line = ray[index] ^ ray[second]
+                pins[SQUARE_NAMES[first]] = set(iter_squares(line))
+        return pins
+
+    def affected(self, squares):
+        """
+        finds the squares of every piece whose moves depend on the given
+        squares: their occupants, sliders whose rays reach them, and pawns,
+        knights and kings close enough to step onto them
+        :param squares: the squares whose occupants changed
+        :return: int bitmask
+        """
+        types = self._types
+        occupied = self._occupied['W'] | self._occupied['B']
+        steppers = types[PAWN] | types[KNIGHT] | types[KING]
+        straight = types[ROOK] | types[QUEEN]
+        diagonal = types[BISHOP] | types[QUEEN]
+        found = 0
+        for square in squares:
+            index = SQUARE_INDEX[square]
+            found |= (1 << index) | (NEARBY_MASKS[index] & steppers)
+            if straight:
+                found |= slider_attacks(index, occupied,
+                                        STRAIGHT_LINES) & straight
+            if diagonal:
+                found |= slider_attacks(index, occupied,
+                                        DIAGONAL_LINES) & diagonal
+        return found & occupied
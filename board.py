@@ -5,13 +5,81 @@ The Board class, which is used as a parameter of Chess
 """
 import os
 
+from zobrist import piece_key
+
+FILES = 'abcdefgh'
+RANKS = '12345678'
+SQUARES = tuple(f"{f}{r}" for r in RANKS for f in FILES)
+
+# (file step, rank step) for each direction a piece can move in
+ORTHOGONAL = ((0, 1), (1, 0), (0, -1), (-1, 0))
+DIAGONAL = ((1, 1), (1, -1), (-1, -1), (-1, 1))
+KNIGHT_STEPS = ((-1, 2), (1, 2), (2, 1), (2, -1),
+                (1, -2), (-1, -2), (-2, 1), (-2, -1))
+KING_STEPS = ORTHOGONAL + DIAGONAL
+
+
+def offset(square, df, dr):
+    """
+    finds the square a number of files and ranks away from another
+    :param square: the starting coordinates. Ex. 'a2'
+    :param df: files to the right (negative for left)
+    :param dr: ranks up (negative for down)
+    :return: coordinates, or None if off the board
+    """
+    file = FILES.find(square[0]) + df
+    rank = RANKS.find(square[1]) + dr
+    if 0 <= file < 8 and 0 <= rank < 8:
+        return f"{FILES[file]}{RANKS[rank]}"
+    return None
+
+
+def _steps_from(square, steps):
+    """returns the on-board squares one step away, in the order given"""
+    targets = (offset(square, df, dr) for df, dr in steps)
+    return tuple(target for target in targets if target is not None)
+
+
+def _ray(square, step):
+    """returns the squares along a ray, nearest first"""
+    ray = []
+    square = offset(square, *step)
+    while square is not None:
+        ray.append(square)
+        square = offset(square, *step)
+    return tuple(ray)
+
+
+# lookup tables, built once at import, of square -> tuple of squares
+KNIGHT_TARGETS = {sq: _steps_from(sq, KNIGHT_STEPS) for sq in SQUARES}
+KING_TARGETS = {sq: _steps_from(sq, KING_STEPS) for sq in SQUARES}
+RAYS = {step: {sq: _ray(sq, step) for sq in SQUARES}
+        for step in ORTHOGONAL + DIAGONAL}
+# single then double step, and captures to the right then left
+PAWN_PUSHES = {
+    'W': {sq: _steps_from(sq, ((0, 1), (0, 2))) for sq in SQUARES},
+    'B': {sq: _steps_from(sq, ((0, -1), (0, -2))) for sq in SQUARES},
+}
+PAWN_CAPTURES = {
+    'W': {sq: _steps_from(sq, ((1, 1), (-1, 1))) for sq in SQUARES},
+    'B': {sq: _steps_from(sq, ((1, -1), (-1, -1))) for sq in SQUARES},
+}
+# every square within two files and two ranks, including the square itself
+NEARBY = {
+    sq: _steps_from(sq, [(df, dr) for df in range(-2, 3)
+                         for dr in range(-2, 3)])
+    for sq in SQUARES
+}
+
 
 class Board:
     """Represents a chess board"""
     def __init__(self):
-        """initialize single data member"""
+        """initialize data members"""
         self._board = self._initialize_board()
         self._image = os.path.join("assets", "chess_board.png")
+        self._squares = {}  # square -> piece object, for O(1) lookups
+        self._hash = 0  # Zobrist hash of the pieces in the index
 
     @staticmethod
     def _initialize_board():
@@ -35,3 +103,42 @@ class Board:
     def get_image(self):
         """returns the file path of the board image"""
         return self._image
+
+    def get_piece(self, square):
+        """
+        returns the piece occupying a square
+        :param square: the coordinates of the square to check. Ex. 'a2'
+        :return: piece object, or None if not occupied
+        """
+        return self._squares.get(square)
+
+    def get_squares(self):
+        """returns the square index as a dict of square -> piece object"""
+        return self._squares
+
+    def relocate(self, piece, old, new):
+        """
+        keeps the square index in sync when a piece changes position
+        :param piece: the piece object being moved
+        :param old: the square the piece is leaving, or None
+        :param new: the square the piece is entering, or None if captured
+        :return: nothing
+        """
+        if old is not None and self._squares.get(old) is piece:
+            del self._squares[old]
+            self._hash ^= piece_key(piece, old)
+        if new is not None:
+            displaced = self._squares.get(new)
+            if displaced is not None:
+                self._hash ^= piece_key(displaced, new)
+            self._squares[new] = piece
+            self._hash ^= piece_key(piece, new)
+
+    def clear(self):
+        """empties the square index"""
+        self._squares = {}
+        self._hash = 0
+
+    def get_hash(self):
+        """returns the Zobrist hash of the pieces on the board"""
+        return self._hash
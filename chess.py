@@ -3,8 +3,12 @@ Written by Lucas Jensen
 Last updated 3/26/2022
 The Chess class which contains a majority of the gameplay logic
 """
-from pieces import Pawn, Rook, Bishop, Knight, Queen, King, Piece
-from board import Board
+from pieces import (Pawn, Rook, Bishop, Knight, Queen, King, Piece, PAWN,
+                    KNIGHT, BISHOP, ROOK, QUEEN, KING)
+from board import (Board, ORTHOGONAL, DIAGONAL, RAYS, NEARBY, KNIGHT_TARGETS,
+                   KING_TARGETS, PAWN_PUSHES, PAWN_CAPTURES)
+from bitboard import BitboardBoard, SQUARE_INDEX, iter_squares
+from zobrist import TranspositionTable, BLACK_TO_MOVE
 from time import time
 
 
@@ -13,22 +17,125 @@ class Chess:
     and uses two other classes to create
     portions of the game as objects."""
 
-    def __init__(self, creation=time()):
-        """Initialize all data members as private"""
-        self._board = Board()
+    # each direction, and the piece sliding that way besides the Queen
+    _RAY_SLIDERS = (tuple((step, ROOK) for step in ORTHOGONAL)
+                    + tuple((step, BISHOP) for step in DIAGONAL))
+
+    def __init__(self, creation=time(), bitboard=False, debug=False,
+                 fen=None, table_size=0):
+        """
+        Initialize all data members as private
+        :param creation: timestamp of the game's creation
+        :param bitboard: generate moves from 64-bit occupancy masks instead
+        of square strings
+        :param debug: verify every incremental update against a full
+        recompute
+        :param fen: start from a FEN position instead of the opening. Only
+        the placement, side to move and move number fields are used
+        :param table_size: number of positions whose legal moves and targets
+        are cached, ex. for perft or a search that pops back to positions it
+        has seen. Each entry holds every piece's moves, so the cache is off
+        by default (0): a game played forward rarely repeats a position
+        """
+        # attacks, checks and pins are answered from the board's masks too
+        self._bitboard = bitboard
+        if bitboard:
+            self._board = BitboardBoard()
+        else:
+            self._board = Board()
         self._turn_count = 0
         self._time = creation
         self._game_state = "UNFINISHED"
-        self._pieces = self._make_pieces()
+        self._debug = debug
+        self._history = []  # undo entries for push() and pop()
+        # legal moves and targets of recently seen positions, if enabled
+        self._table = TranspositionTable(table_size) if table_size else None
+        if fen:
+            self._pieces = self._pieces_from_fen(fen)
+        else:
+            self._pieces = self._make_pieces()
+        self._index_pieces()
+        self._repetitions = {self.get_hash(): 1}
+        self._update_legal_moves()
+        self._update_targets()
+        self._check_for_check()
+        self._update_game_state()
+
+    def __getstate__(self):
+        """pickles the game without its transposition table's contents"""
+        state = self.__dict__.copy()
+        table = state.pop('_table')
+        state['_table_size'] = (table.get_stats()["size"]
+                                if table is not None else 0)
+        return state
+
+    def __setstate__(self, state):
+        """
+        restores a pickled game, rebuilding the square index and every
+        piece's moves. Saves made by older versions hold move lists worked
+        out by other rules, so they are never trusted
+        """
+        self._debug = False
+        self._history = []
+        self._repetitions = {}
+        table_size = state.pop('_table_size', 0)
+        self.__dict__.update(state)
+        self._bitboard = isinstance(self._board, BitboardBoard)
+        self._table = TranspositionTable(table_size) if table_size else None
+        self._index_pieces()
         self._update_legal_moves()
         self._update_targets()
 
+    def _index_pieces(self):
+        """
+        registers every piece with the board's square index
+        :return: nothing
+        """
+        self._board.clear()
+        self._kings = {}
+        for piece in self._pieces:
+            piece.set_board(self._board)
+            if piece.TYPE == KING:
+                self._kings[piece.get_color()] = piece
+
     def get_time(self):
         return self._time
 
     def get_turn(self):
         return self._turn_count
 
+    def get_hash(self):
+        """returns the Zobrist hash of the position and side to move"""
+        if self._turn_count % 2 == 0:
+            return self._board.get_hash()
+        else:
+            return self._board.get_hash() ^ BLACK_TO_MOVE
+
+    def get_table(self):
+        """returns the transposition table of cached legal moves, or None"""
+        return self._table
+
+    def is_repetition(self, times=3):
+        """
+        determines whether the current position has occurred enough times
+        :param times: number of occurrences, including the current one
+        :return: bool
+        """
+        return self._repetitions.get(self.get_hash(), 0) >= times
+
+    def _count_position(self, change):
+        """
+        adds to the number of times the current position has occurred
+        :param change: 1 when a position is reached, -1 when it is undone
+        :return: nothing
+        """
+        key = self.get_hash()
+        count = self._repetitions.get(key, 0) + change
+        if count > 0:
+            self._repetitions[key] = count
+        else:
+            self._repetitions.pop(key, None)
+
     def get_pieces(self):
         """returns a list of all pieces"""
         return self._pieces
@@ -47,76 +154,365 @@ class Chess:
         :param sq_to: destination
         :return: bool
         """
-        piece = self.get_piece_by_square(sq_from)
         opponent = self.get_piece_by_square(sq_to)
-        if piece:
-            if self._is_valid_move(sq_from, sq_to):
-                self._move_piece(sq_from, sq_to)
-                # the piece now exists in sq_to instead of sq_from
-                self._update_legal_moves()
-                self._update_targets()
-                self._check_for_check()
-
-                # check for checkmate
-                # TODO :(
-
-                # check for self check
-                for piece in self._pieces:
-                    if piece.get_piece_type() == "King":
-                        if (piece.get_check()
-                                and (piece.get_color() ==
-                                     self.get_piece_by_square(sq_to).
-                                     get_color())):
-                            self._move_piece(sq_to, sq_from)
-                            if opponent:
-                                opponent._is_captured = False
-                                opponent.set_position(sq_to)
-                            self._update_legal_moves()
-                            self._update_targets()
-
-                            return False
-
-                self._turn_count += 1
-                self._time = time()
-                return True
+        if self.push(sq_from, sq_to):
+            if opponent:
+                if opponent.get_color() == 'W':
+                    color = 'White'
+                else:
+                    color = 'Black'
+                print(f"{color} {opponent.get_piece_type()} captured!")
+            self._time = time()
+            self._update_game_state()
+            return True
 
         return False
 
-    def _is_checkmate(self, sq_from, sq_to):
-        """TODO: this doesn't do anything meaningful"""
-        for piece in self._pieces:
-            if piece.get_color() == self.get_active_player():
-                for move in piece.get_legal_moves():
-                    orig = piece.get_position()
-                    target = self.get_piece_by_square(move)
-                    if self.make_move(orig, move):
-                        self._turn_count -= 1
-                        piece.set_position(orig)
-                        if target:
-                            target._captured = False
-                            target.set_position(move)
-                        return False
+    def push(self, sq_from, sq_to):
+        """
+        Plays a move and records how to undo it with pop(). Moves that are
+        invalid or that leave the mover in check are rejected.
+        :param sq_from: origination
+        :param sq_to: destination
+        :return: bool
+        """
+        piece = self.get_piece_by_square(sq_from)
+        if not piece or not self._is_valid_move(sq_from, sq_to):
+            return False
+
+        # everything needed to put the position back, see pop()
+        self._history.append((
+            sq_from,
+            sq_to,
+            piece,
+            self.get_piece_by_square(sq_to),
+            piece.get_has_moved(),
+            len(self._pieces),
+            self._time,
+            self._game_state,
+            self._kings['W'].get_check(),
+            self._kings['B'].get_check(),
+        ))
+
+        self._move_piece(sq_from, sq_to)
+        # the piece now exists in sq_to instead of sq_from
+        self._refresh_squares(sq_from, sq_to)
+        self._turn_count += 1
+        self._count_position(1)
+
+        # check for self check
+        color = piece.get_color()
+        if self.is_square_attacked(self._kings[color].get_position(),
+                                   self.get_active_player()):
+            self.pop()
+            return False
+
+        self._check_for_check()
 
         return True
 
+    def pop(self):
+        """
+        Takes back the most recent move played with push() or make_move()
+        :return: the (sq_from, sq_to) pair that was undone
+        """
+        (sq_from, sq_to, piece, captured, has_moved, piece_count, created,
+         game_state, white_check, black_check) = self._history.pop()
+        self._count_position(-1)
+
+        # remove a queen given by pawn promotion
+        for promoted in self._pieces[piece_count:]:
+            promoted.set_is_captured()
+        del self._pieces[piece_count:]
+
+        piece.set_is_captured(False)
+        piece.set_position(sq_from)
+        piece.set_has_moved(has_moved)
+        if captured:
+            captured.set_is_captured(False)
+            captured.set_position(sq_to)
+
+        self._turn_count -= 1
+        self._time = created
+        self._game_state = game_state
+        self._kings['W'].set_check(white_check)
+        self._kings['B'].set_check(black_check)
+        self._refresh_squares(sq_from, sq_to)
+
+        return sq_from, sq_to
+
+    def get_history(self):
+        """returns the list of undo entries, oldest first"""
+        return self._history
+
+    def get_game_state(self):
+        """returns 'UNFINISHED', 'CHECK', 'CHECKMATE' or 'STALEMATE'"""
+        return self._game_state
+
+    def _update_game_state(self):
+        """
+        sets the game state for the active player from attack and pin maps,
+        without trying any moves
+        :return: nothing
+        """
+        color = self.get_active_player()
+        if self._kings[color].get_position() is None:
+            # only possible in games saved before self check was enforced
+            self._game_state = "CHECKMATE"
+            return
+
+        checkers = self._find_checkers(color)
+        has_move = self._has_legal_move(color, checkers)
+
+        if self._debug and has_move != self._has_legal_move_by_trial():
+            raise AssertionError(
+                f"terminal state mismatch for {color}: pin and attack maps "
+                f"say has_move={has_move}")
+
+        if has_move:
+            self._game_state = "CHECK" if checkers else "UNFINISHED"
+        elif checkers:
+            self._game_state = "CHECKMATE"
+        else:
+            self._game_state = "STALEMATE"
+
+    def _has_legal_move(self, color, checkers):
+        """
+        determines whether a player has any move that does not leave their
+        king in check
+        :param color: 'W' or 'B'
+        :param checkers: list of (square, path) pairs from _find_checkers
+        :return: bool
+        """
+        king = self._kings[color]
+        enemy_attacks = self._attack_map('B' if color == 'W' else 'W', king)
+        for move in king.get_legal_moves():
+            if move not in enemy_attacks:
+                return True
+
+        if len(checkers) > 1:
+            # only the king can escape a double check
+            return False
+
+        if checkers:
+            square, path = checkers[0]
+            # capture the checker, or block a sliding check
+            escapes = set(path)
+            escapes.add(square)
+        else:
+            escapes = None
+
+        pins = self._find_pins(color)
+        for square, piece in list(self._board.get_squares().items()):
+            if piece.get_color() != color or piece is king:
+                continue
+            for move in piece.get_legal_moves():
+                if escapes is not None and move not in escapes:
+                    continue
+                if square in pins and move not in pins[square]:
+                    continue
+                return True
+
+        return False
+
+    def _has_legal_move_by_trial(self):
+        """
+        determines whether the active player has a legal move by placing
+        each candidate on the board and looking for checks. Only used to
+        verify _has_legal_move in debug mode.
+        :return: bool
+        """
+        color = self.get_active_player()
+        for piece in list(self._pieces):
+            if piece.get_color() != color or piece.get_position() is None:
+                continue
+            orig = piece.get_position()
+            for move in piece.get_legal_moves():
+                captured = self._board.get_piece(move)
+                if captured:
+                    captured.set_is_captured()
+                piece.set_position(move)
+                safe = not self._find_checkers(color)
+                piece.set_position(orig)
+                if captured:
+                    captured.set_is_captured(False)
+                    captured.set_position(move)
+                if safe:
+                    return True
+
+        return False
+
+    def _attack_map(self, color, ignore=None):
+        """
+        finds every square a player's pieces attack
+        :param color: the attacking player, 'W' or 'B'
+        :param ignore: a piece to treat as absent, so that sliders attack
+        the squares behind it. Used for the defending king
+        :return: set of squares
+        """
+        if self._bitboard:
+            return set(iter_squares(self._board.attack_mask(color, ignore)))
+
+        board = self._board
+        attacked = set()
+        for square, piece in list(board.get_squares().items()):
+            if piece.get_color() != color:
+                continue
+            piece_type = piece.TYPE
+            if piece_type == PAWN:
+                attacked.update(PAWN_CAPTURES[color][square])
+            elif piece_type == KNIGHT:
+                attacked.update(KNIGHT_TARGETS[square])
+            elif piece_type == KING:
+                attacked.update(KING_TARGETS[square])
+            else:
+                for step, slider in self._RAY_SLIDERS:
+                    if piece_type != QUEEN and piece_type != slider:
+                        continue
+                    for target in RAYS[step][square]:
+                        attacked.add(target)
+                        blocker = board.get_piece(target)
+                        if blocker is not None and blocker is not ignore:
+                            break
+
+        return attacked
+
+    def _find_checkers(self, color):
+        """
+        finds the opposing pieces that attack a player's king
+        :param color: the defending player, 'W' or 'B'
+        :return: list of (square, path) pairs, where path lists the squares
+        between a sliding checker and the king
+        """
+        if self._bitboard:
+            return self._board.checkers(self._kings[color])
+
+        board = self._board
+        king_square = self._kings[color].get_position()
+        enemy = 'B' if color == 'W' else 'W'
+        checkers = []
+
+        for square in KNIGHT_TARGETS[king_square]:
+            piece = board.get_piece(square)
+            if piece and piece.TYPE == KNIGHT and piece.get_color() == enemy:
+                checkers.append((square, ()))
+
+        # never true after a legal move, but lets trial king moves be tested
+        for square in KING_TARGETS[king_square]:
+            piece = board.get_piece(square)
+            if piece and piece.TYPE == KING and piece.get_color() == enemy:
+                checkers.append((square, ()))
+
+        # an enemy pawn attacks the king from where the king would capture
+        for square in PAWN_CAPTURES[color][king_square]:
+            piece = board.get_piece(square)
+            if piece and piece.TYPE == PAWN and piece.get_color() == enemy:
+                checkers.append((square, ()))
+
+        for step, slider in self._RAY_SLIDERS:
+            path = []
+            for square in RAYS[step][king_square]:
+                piece = board.get_piece(square)
+                if piece is None:
+                    path.append(square)
+                    continue
+                if (piece.get_color() == enemy
+                        and piece.TYPE in (slider, QUEEN)):
+                    checkers.append((square, tuple(path)))
+                break
+
+        return checkers
+
+    def _find_pins(self, color):
+        """
+        finds a player's pieces that cannot leave the line between their
+        king and an opposing slider
+        :param color: the defending player, 'W' or 'B'
+        :return: dict of pinned square -> set of squares it may move to
+        """
+        if self._bitboard:
+            return self._board.pins(self._kings[color])
+
+        board = self._board
+        king_square = self._kings[color].get_position()
+        pins = {}
+
+        for step, slider in self._RAY_SLIDERS:
+            line = set()
+            pinned = None
+            for square in RAYS[step][king_square]:
+                line.add(square)
+                piece = board.get_piece(square)
+                if piece is None:
+                    continue
+                if pinned is None and piece.get_color() == color:
+                    pinned = square
+                    continue
+                if (pinned is not None and piece.get_color() != color
+                        and piece.TYPE in (slider, QUEEN)):
+                    pins[pinned] = line
+                break
+
+        return pins
+
     def _check_for_check(self):
         """
-        checks all piece targets for check and sets king object attributes
+        checks whether either king is attacked and sets king object
+        attributes and the game state
         :return: nothing
         """
-        for piece in self._pieces:
-            if piece.get_position() is not None:
-                for target in piece.get_targets():
-                    target = self.get_piece_by_square(target)
-                    if target.get_piece_type() == "King":
-                        self._game_state = "CHECK"
-                        target.set_check(True)
-                        return
+        self._game_state = "UNFINISHED"
+        for color, king in self._kings.items():
+            enemy = 'B' if color == 'W' else 'W'
+            square = king.get_position()
+            if square is not None and self.is_square_attacked(square, enemy):
+                self._game_state = "CHECK"
+                king.set_check(True)
+            else:
+                king.set_check(False)
+
+    def is_square_attacked(self, square, by_color):
+        """
+        determines whether any of a player's pieces attacks a square, by
+        looking outward from the square and stopping at the first attacker
+        :param square: the coordinates of the square to check. Ex. 'e1'
+        :param by_color: the attacking player, 'W' or 'B'
+        :return: bool
+        """
+        if self._bitboard:
+            return bool(self._board.attackers(SQUARE_INDEX[square], by_color))
 
-        for piece in self._pieces:
-            if piece.get_piece_type() == "King":
-                self._game_state = "UNFINISHED"
-                piece.set_check(False)
+        board = self._board
+        defender = 'B' if by_color == 'W' else 'W'
+
+        for target in KNIGHT_TARGETS[square]:
+            piece = board.get_piece(target)
+            if (piece and piece.TYPE == KNIGHT
+                    and piece.get_color() == by_color):
+                return True
+
+        # a pawn attacks the square from where a defending pawn would capture
+        for target in PAWN_CAPTURES[defender][square]:
+            piece = board.get_piece(target)
+            if piece and piece.TYPE == PAWN and piece.get_color() == by_color:
+                return True
+
+        for target in KING_TARGETS[square]:
+            piece = board.get_piece(target)
+            if piece and piece.TYPE == KING and piece.get_color() == by_color:
+                return True
+
+        for step, slider in self._RAY_SLIDERS:
+            for target in RAYS[step][square]:
+                piece = board.get_piece(target)
+                if piece is None:
+                    continue
+                if (piece.get_color() == by_color
+                        and piece.TYPE in (slider, QUEEN)):
+                    return True
+                break
+
+        return False
 
     def _update_legal_moves(self):
         """
@@ -134,19 +530,125 @@ class Chess:
         :return: nothing
         """
         for piece in self._pieces:
-            targets = []
-            for move in piece.get_legal_moves():
-                if self.get_piece_by_square(move):
-                    if (self.get_piece_by_square(move).get_color()
-                            != piece.get_color()):
-                        if piece.get_piece_type() == "Pawn":
-                            # pawn is unique in being only able to
-                            # attack diagonally
-                            if move[0] != piece.get_position():
-                                targets.append(move)
-                        else:
+            piece.set_targets(self._find_targets(piece))
+
+    def _find_targets(self, piece):
+        """
+        finds the legal moves of a piece that would capture an opponent
+        :param piece: the piece object
+        :return: list of target squares
+        """
+        targets = []
+        for move in piece.get_legal_moves():
+            if self.get_piece_by_square(move):
+                if (self.get_piece_by_square(move).get_color()
+                        != piece.get_color()):
+                    if piece.TYPE == PAWN:
+                        # pawn is unique in being only able to
+                        # attack diagonally
+                        if move[0] != piece.get_position():
                             targets.append(move)
-            piece.set_targets(targets)
+                    else:
+                        targets.append(move)
+
+        return targets
+
+    def _refresh_squares(self, *squares):
+        """
+        updates legal moves and targets for only the pieces that can be
+        affected by a change in the occupancy of the given squares
+        :param squares: the squares whose occupants changed
+        :return: nothing
+        """
+        # legal moves do not depend on the side to move, so the board hash
+        # alone identifies them
+        key = self._board.get_hash()
+        cached = self._table.get(key) if self._table is not None else None
+        if cached is not None:
+            for square, (moves, targets) in cached.items():
+                piece = self._board.get_piece(square)
+                piece.set_legal_moves(moves)
+                piece.set_targets(targets)
+        else:
+            affected = self._affected_pieces(squares)
+            if self._bitboard:
+                for piece in affected:
+                    moves, targets = self._board.moves_and_targets(piece)
+                    piece.set_legal_moves(moves)
+                    piece.set_targets(targets)
+            else:
+                for piece in affected:
+                    piece.set_legal_moves(
+                        self.legal_moves(piece.get_position()))
+                for piece in affected:
+                    piece.set_targets(self._find_targets(piece))
+            if self._table is not None:
+                self._table.store(key, {
+                    square: (piece.get_legal_moves(), piece.get_targets())
+                    for square, piece in self._board.get_squares().items()
+                })
+
+        if self._debug:
+            self._verify_incremental()
+
+    def _affected_pieces(self, squares):
+        """
+        finds every piece whose legal moves depend on the given squares:
+        their occupants, sliders whose rays reach them, and pawns, knights
+        and kings close enough to step onto them
+        :param squares: the squares whose occupants changed
+        :return: list of piece objects, without duplicates
+        """
+        if self._bitboard:
+            board = self._board
+            return [board.get_piece(square)
+                    for square in iter_squares(board.affected(squares))]
+
+        affected = []
+        for square in squares:
+            # pawns move up to two ranks, knights and kings up to two files
+            for nearby in NEARBY[square]:
+                piece = self._board.get_piece(nearby)
+                if piece and piece not in affected:
+                    if (piece.TYPE in (PAWN, KNIGHT, KING)
+                            or nearby == square):
+                        affected.append(piece)
+
+            # the first piece along each ray may be a slider looking back
+            for step, slider in self._RAY_SLIDERS:
+                for neighbor in RAYS[step][square]:
+                    piece = self._board.get_piece(neighbor)
+                    if piece:
+                        if (piece.TYPE in (slider, QUEEN)
+                                and piece not in affected):
+                            affected.append(piece)
+                        break
+
+        return affected
+
+    def _verify_incremental(self):
+        """
+        compares the incrementally updated legal moves and targets against a
+        full recompute. Only used in debug mode.
+        :return: nothing
+        """
+        incremental = {}
+        for piece in self._pieces:
+            if piece.get_position() is not None:
+                incremental[piece] = (sorted(piece.get_legal_moves()),
+                                      sorted(piece.get_targets()))
+
+        self._update_legal_moves()
+        self._update_targets()
+
+        for piece, (moves, targets) in incremental.items():
+            expected = (sorted(piece.get_legal_moves()),
+                        sorted(piece.get_targets()))
+            if (moves, targets) != expected:
+                raise AssertionError(
+                    f"stale moves for {piece.get_color()} "
+                    f"{piece.get_piece_type()} on {piece.get_position()}: "
+                    f"{(moves, targets)} != {expected}")
 
     def _is_valid_move(self, sq_from, sq_to):
         """
@@ -179,17 +681,20 @@ class Chess:
         """
         piece = self.get_piece_by_square(sq_from)
         if piece.get_position() is not None:
-            if piece.get_piece_type() == "Pawn":
+            if self._bitboard:
+                return self._board.legal_moves(piece)
+            piece_type = piece.TYPE
+            if piece_type == PAWN:
                 return self._pawn_moves(sq_from)
-            elif piece.get_piece_type() == "Knight":
+            elif piece_type == KNIGHT:
                 return self._knight_moves(sq_from)
-            elif piece.get_piece_type() == "Rook":
+            elif piece_type == ROOK:
                 return self._rook_moves(sq_from)
-            elif piece.get_piece_type() == "Bishop":
+            elif piece_type == BISHOP:
                 return self._bishop_moves(sq_from)
-            elif piece.get_piece_type() == "Queen":
+            elif piece_type == QUEEN:
                 return self._queen_moves(sq_from)
-            elif piece.get_piece_type() == "King":
+            elif piece_type == KING:
                 return self._king_moves(sq_from)
         else:
             return False
@@ -201,48 +706,21 @@ class Chess:
         :return: list of valid moves
         """
         pawn = self.get_piece_by_square(sq_from)
-
-        # make list of all possible pawn moves
-        possible = []
-        if pawn.get_color() == 'W':
-            square = f"{sq_from[0]}{int(sq_from[1]) + 1}"
-            if self.get_square_occupant(square) == 'NONE':
-                possible.append(square)
-            square = f"{sq_from[0]}{int(sq_from[1]) + 2}"
-            if (not pawn.get_has_moved()
-                    and self.get_square_occupant(square) == 'NONE'):
-                possible.append(square)
-            square = f"{chr(ord(sq_from[0]) + 1)}{int(sq_from[1]) + 1}"
-            if self.get_square_occupant(square) == 'B':
-                possible.append(square)
-            square = f"{chr(ord(sq_from[0]) - 1)}{int(sq_from[1]) + 1}"
-            if self.get_square_occupant(square) == 'B':
-                possible.append(square)
-
-        else:
-            # pawn must be black
-            square = f"{sq_from[0]}{int(sq_from[1]) - 1}"
-            if self.get_square_occupant(square) == 'NONE':
-                possible.append(square)
-            square = f"{sq_from[0]}{int(sq_from[1]) - 2}"
-            if (not pawn.get_has_moved()
-                    and self.get_square_occupant(square) == 'NONE'):
-                possible.append(square)
-            square = f"{chr(ord(sq_from[0]) + 1)}{int(sq_from[1]) - 1}"
-            if self.get_square_occupant(square) == 'W':
-                possible.append(square)
-            square = f"{chr(ord(sq_from[0]) - 1)}{int(sq_from[1]) - 1}"
-            if self.get_square_occupant(square) == 'W':
-                possible.append(square)
+        color = pawn.get_color()
+        enemy = 'B' if color == 'W' else 'W'
+        board = self._board
 
         valid = []
+        pushes = PAWN_PUSHES[color][sq_from]
+        if pushes and board.get_piece(pushes[0]) is None:
+            valid.append(pushes[0])
+            if (not pawn.get_has_moved() and len(pushes) > 1
+                    and board.get_piece(pushes[1]) is None):
+                valid.append(pushes[1])
 
-        for move in possible:
-            if (move[0] in self._valid_alpha()
-                    and move[1] in self._valid_nums()):
-                if (self.get_square_occupant(move)
-                        != self.get_square_occupant(sq_from)):
-                    valid.append(move)
+        for square in PAWN_CAPTURES[color][sq_from]:
+            if self.get_square_occupant(square) == enemy:
+                valid.append(square)
 
         return valid
 
@@ -254,18 +732,7 @@ class Chess:
         """
         rook = self.get_piece_by_square(sq_from)
 
-        possible = self._find_horz_vert(rook, sq_from)
-
-        valid = []
-
-        for move in possible:
-            if (move[0] in self._valid_alpha()
-                    and move[1] in self._valid_nums()):
-                if (self.get_square_occupant(move)
-                        != self.get_square_occupant(sq_from)):
-                    valid.append(move)
-
-        return valid
+        return self._find_horz_vert(rook, sq_from)
 
     def _knight_moves(self, sq_from):
         """
@@ -273,27 +740,10 @@ class Chess:
         :param sq_from: origination square
         :return: list of valid moves
         """
-        possible = [  # clockwise from up-up-left
-            f"{chr(ord(sq_from[0]) - 1)}{int(sq_from[1]) + 2}",
-            f"{chr(ord(sq_from[0]) + 1)}{int(sq_from[1]) + 2}",
-            f"{chr(ord(sq_from[0]) + 2)}{int(sq_from[1]) + 1}",
-            f"{chr(ord(sq_from[0]) + 2)}{int(sq_from[1]) - 1}",
-            f"{chr(ord(sq_from[0]) + 1)}{int(sq_from[1]) - 2}",
-            f"{chr(ord(sq_from[0]) - 1)}{int(sq_from[1]) - 2}",
-            f"{chr(ord(sq_from[0]) - 2)}{int(sq_from[1]) + 1}",
-            f"{chr(ord(sq_from[0]) - 2)}{int(sq_from[1]) - 1}",
-        ]
+        color = self.get_square_occupant(sq_from)
 
-        valid = []
-
-        for move in possible:
-            if (move[0] in self._valid_alpha()
-                    and move[1] in self._valid_nums()):
-                if (self.get_square_occupant(move)
-                        != self.get_square_occupant(sq_from)):
-                    valid.append(move)
-
-        return valid
+        return [move for move in KNIGHT_TARGETS[sq_from]
+                if self.get_square_occupant(move) != color]
 
     def _bishop_moves(self, sq_from):
         """
@@ -303,18 +753,7 @@ class Chess:
         """
         bishop = self.get_piece_by_square(sq_from)
 
-        possible = self._find_diagonals(bishop, sq_from)
-
-        valid = []
-
-        for move in possible:
-            if (move[0] in self._valid_alpha()
-                    and move[1] in self._valid_nums()):
-                if (self.get_square_occupant(move)
-                        != self.get_square_occupant(sq_from)):
-                    valid.append(move)
-
-        return valid
+        return self._find_diagonals(bishop, sq_from)
 
     def _queen_moves(self, sq_from):
         """
@@ -324,22 +763,8 @@ class Chess:
         """
         queen = self.get_piece_by_square(sq_from)
 
-        diags = self._find_diagonals(queen, sq_from)
-        possible = self._find_horz_vert(queen, sq_from)
-
-        for move in diags:
-            possible.append(move)
-
-        valid = []
-
-        for move in possible:
-            if (move[0] in self._valid_alpha()
-                    and move[1] in self._valid_nums()):
-                if (self.get_square_occupant(move)
-                        != self.get_square_occupant(sq_from)):
-                    valid.append(move)
-
-        return valid
+        return (self._find_horz_vert(queen, sq_from)
+                + self._find_diagonals(queen, sq_from))
 
     def _king_moves(self, sq_from):
         """
@@ -347,29 +772,10 @@ class Chess:
         :param sq_from: origination square
         :return: list of valid desinations
         """
-        # king = self.get_piece_by_square(sq_from)
-
-        valid = []
-        possible = [
-            f"{sq_from[0]}{int(sq_from[1]) + 1}",
-            f"{chr(ord(sq_from[0]) + 1)}{int(sq_from[1]) + 1}",
-            f"{chr(ord(sq_from[0]) + 1)}{int(sq_from[1])}",
-            f"{chr(ord(sq_from[0]) + 1)}{int(sq_from[1]) - 1}",
-            f"{sq_from[0]}{int(sq_from[1]) - 1}",
-            f"{chr(ord(sq_from[0]) - 1)}{int(sq_from[1]) - 1}",
-            f"{chr(ord(sq_from[0]) - 1)}{int(sq_from[1])}",
-            f"{chr(ord(sq_from[0]) - 1)}{int(sq_from[1]) + 1}",
-        ]
-
-        for move in possible:
-            if (move[0] in self._valid_alpha()
-                    and move[1] in self._valid_nums()):
-                if (self.get_square_occupant(move)
-                        != self.get_square_occupant(sq_from)):
-                    # if not self.self_check(sq_from, move):
-                    valid.append(move)
+        color = self.get_square_occupant(sq_from)
 
-        return valid
+        return [move for move in KING_TARGETS[sq_from]
+                if self.get_square_occupant(move) != color]
 
     def _move_piece(self, sq_from, sq_to):
         """
@@ -382,24 +788,23 @@ class Chess:
         opponent = self.get_piece_by_square(sq_to)
         if opponent:
             if opponent.get_color() != piece.get_color():
-                if opponent.get_color() == 'W':
-                    color = 'White'
-                else:
-                    color = 'Black'
-                print(f"{color} {opponent.get_piece_type()} captured!")
                 opponent.set_is_captured()
 
         piece.set_has_moved()
         piece.set_position(sq_to)
 
         # handle pawn promotion. Just give them a Queen.
+        if piece.TYPE != PAWN:
+            return
         if sq_to[1] == '8' and piece.get_color() == 'W':
             piece.set_is_captured()
             queen = Queen('W', sq_to)
+            queen.set_board(self._board)
             self._pieces.append(queen)
         elif sq_to[1] == '1' and piece.get_color() == 'B':
             piece.set_is_captured()
             queen = Queen('B', sq_to)
+            queen.set_board(self._board)
             self._pieces.append(queen)
 
     def _find_horz_vert(self, piece, sq_from):
@@ -409,65 +814,7 @@ class Chess:
         :param sq_from: origination
         :return: list of valid horizontal and vertical destinations
         """
-        valid = []
-
-        # check up
-        for i in range(8):
-            square = f"{sq_from[0]}{int(sq_from[1]) + i}"
-            if square == sq_from:
-                continue
-            if self.get_square_occupant(square) == piece.get_color():
-                break
-            if (square[0] not in self._valid_alpha()
-                    or square[1] not in self._valid_nums()):
-                break
-            valid.append(square)
-            if self.is_occupied(square):
-                break
-
-        # check to right
-        for i in range(8):
-            square = f"{chr(ord(sq_from[0]) + i)}{int(sq_from[1])}"
-            if square == sq_from:
-                continue
-            if self.get_square_occupant(square) == piece.get_color():
-                break
-            if (square[0] not in self._valid_alpha()
-                    or square[1] not in self._valid_nums()):
-                break
-            valid.append(square)
-            if self.is_occupied(square):
-                break
-
-        # check down
-        for i in range(8):
-            square = f"{sq_from[0]}{int(sq_from[1]) - i}"
-            if square == sq_from:
-                continue
-            if self.get_square_occupant(square) == piece.get_color():
-                break
-            if (square[0] not in self._valid_alpha()
-                    or square[1] not in self._valid_nums()):
-                break
-            valid.append(square)
-            if self.is_occupied(square):
-                break
-
-        # check to left
-        for i in range(8):
-            square = f"{chr(ord(sq_from[0]) - i)}{int(sq_from[1])}"
-            if square == sq_from:
-                continue
-            if self.get_square_occupant(square) == piece.get_color():
-                break
-            if (square[0] not in self._valid_alpha()
-                    or square[1] not in self._valid_nums()):
-                break
-            valid.append(square)
-            if self.is_occupied(square):
-                break
-
-        return valid
+        return self._slide(piece, sq_from, ORTHOGONAL)
 
     def _find_diagonals(self, piece, sq_from):
         """
@@ -476,56 +823,29 @@ class Chess:
         :param sq_from: origination
         :return: a list of valid diagonal moves
         """
-        # add valid moves to a list, then check sq_to against list
-        valid = []
-
-        # check up and to right
-        # these checks can go off-board since moves are already verified
-        for i in range(8):
-            square = f"{chr(ord(sq_from[0]) + i)}{int(sq_from[1]) + i}"
-            if square == sq_from:
-                continue
-            if (self.get_square_occupant(square) == piece.get_color()
-                    or square[0] not in self._valid_alpha()):
-                break
-            valid.append(square)
-            if self.is_occupied(square):
-                break
+        return self._slide(piece, sq_from, DIAGONAL)
 
-        # check down and to right
-        for i in range(8):
-            square = f"{chr(ord(sq_from[0]) + i)}{int(sq_from[1]) - i}"
-            if square == sq_from:
-                continue
-            if (self.get_square_occupant(square) == piece.get_color()
-                    or square[0] not in self._valid_alpha()):
-                break
-            valid.append(square)
-            if self.is_occupied(square):
-                break
-
-        # check down and to left
-        for i in range(8):
-            square = f"{chr(ord(sq_from[0]) - i)}{int(sq_from[1]) - i}"
-            if square == sq_from:
-                continue
-            if (self.get_square_occupant(square) == piece.get_color()
-                    or square[0] not in self._valid_alpha()):
-                break
-            valid.append(square)
-            if self.is_occupied(square):
-                break
+    def _slide(self, piece, sq_from, steps):
+        """
+        walks the precomputed rays in each direction until the first
+        blocker, which is included if it belongs to the opponent
+        :param piece: piece object
+        :param sq_from: origination
+        :param steps: the directions to slide in
+        :return: a list of valid destinations
+        """
+        color = piece.get_color()
+        board = self._board
+        valid = []
 
-        # check up and to left
-        for i in range(8):
-            square = f"{chr(ord(sq_from[0]) - i)}{int(sq_from[1]) + i}"
-            if square == sq_from:
-                continue
-            if (self.get_square_occupant(square) == piece.get_color()
-                    or square[0] not in self._valid_alpha()):
-                break
-            valid.append(square)
-            if self.is_occupied(square):
+        for step in steps:
+            for square in RAYS[step][sq_from]:
+                blocker = board.get_piece(square)
+                if blocker is None:
+                    valid.append(square)
+                    continue
+                if blocker.get_color() != color:
+                    valid.append(square)
                 break
 
         return valid
@@ -567,6 +887,48 @@ class Chess:
 
         return pieces
 
+    def _pieces_from_fen(self, fen):
+        """
+        creates pieces from a FEN string and sets the turn counter.
+        Should never be accessed except by init
+        :param fen: Ex. 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b'
+        :return: a list of piece objects
+        """
+        classes = {
+            'p': Pawn,
+            'r': Rook,
+            'n': Knight,
+            'b': Bishop,
+            'q': Queen,
+            'k': King,
+        }
+        fields = fen.split()
+        pieces = []
+
+        for i, row in enumerate(fields[0].split('/')):
+            rank = 8 - i
+            file = 1
+            for char in row:
+                if char.isdigit():
+                    file += int(char)
+                    continue
+                col = 'W' if char.isupper() else 'B'
+                piece = classes[char.lower()](
+                    col, f"{self._num_to_alpha(file)}{rank}")
+                home = 2 if col == 'W' else 7
+                if piece.TYPE == PAWN and rank != home:
+                    piece.set_has_moved()
+                pieces.append(piece)
+                file += 1
+
+        # count half-moves so that get_active_player() is correct
+        full_moves = int(fields[5]) if len(fields) > 5 else 1
+        self._turn_count = 2 * (full_moves - 1)
+        if len(fields) > 1 and fields[1] == 'b':
+            self._turn_count += 1
+
+        return pieces
+
     def is_occupied(self, square):
         """
         Determines of a specified square is occupied
@@ -584,23 +946,19 @@ class Chess:
         :param square: the coordinates of the square to check. Ex. 'a2'
         :return: piece object, or False of not occupied
         """
-        for piece in self._pieces:
-            if piece.get_position() == square:
-                return piece
-
-        return False
+        return self._board.get_piece(square) or False
 
     def get_square_occupant(self, square):
         """
         Determines the color of the occupant of a square, if any
         :param square: the coordinates of the square to check. Ex. 'a2'
-        :return: 'WHITE', 'BLACK', or 'NONE'
+        :return: 'W', 'B', or 'NONE'
         """
-        for piece in self._pieces:
-            if piece.get_position() == square and not piece.get_is_captured():
-                return piece.get_color()
+        piece = self._board.get_piece(square)
+        if piece is None:
+            return 'NONE'
 
-        return 'NONE'
+        return piece.get_color()
 
     @staticmethod
     def _convert_to_coord(index):
@@ -695,16 +1053,6 @@ class Chess:
 
         return num_dict[num]
 
-    @staticmethod
-    def _valid_alpha():
-        """returns a list of valid alpha grid chars"""
-        return ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
-
-    @staticmethod
-    def _valid_nums():
-        """returns a list of valid numbers as strings"""
-        return [str(num) for num in range(1, 9)]
-
 
 if __name__ == "__main__":
     game = Chess()
@@ -1,85 +1,82 @@
-import os
 import pickle
-from chess import Chess
 
+import pygame
 
-def pos_to_pix(pos: str, width: int) -> tuple:
-    """
-    converts a coordinate from the chess class to a pixel position
-    :param pos: position, ex. 'a1'
-    :param width: the width of the Pygame window
-    :return: pixel as tuple
-    """
-    border = (5 / 90) * width
-    tile_size = (1 / 9) * width
+from board import FILES
+from chess import Chess
 
-    # ASCII to coordinates
-    x_pix = border + (ord(pos[0]) - 97) * tile_size
-    y_pix = border + (8 - int(pos[1])) * tile_size
-    pix_tuple = (x_pix, y_pix)
 
-    return pix_tuple
+# these numbers come from the original file dimensions: a board image 900
+# pixels wide has a 50 pixel border around 8 squares of 100 pixels
+BORDER = 5 / 90
+TILE = 1 / 9
 
 
-def pix_to_coord(coord: tuple, border: int, tile_size: float):
+class BoardLayout:
     """
-    converts coordinate (tuple) to a position
+    Where each square of a board is drawn, computed once for a board's
+    place in the window. Answers pixel -> square and square -> rect with
+    arithmetic and lookups, and can show the board from black's side.
     """
-    x = coord[0]
-    y = coord[1]
-    pos = []
+    def __init__(self, rect, flipped=False):
+        """
+        :param rect: pygame.Rect the board is drawn in, ex. (0, 0, 800, 800)
+        :param flipped: draw rank 1 at the top, for the black player
+        """
+        self.rect = pygame.Rect(rect)
+        self.flipped = flipped
+        self.border = BORDER * self.rect.width
+        self.tile_size = TILE * self.rect.width
+        self.piece_size = int(TILE * self.rect.width)
+        self.rects = {
+            f"{file}{rank}": self._square_rect(f"{file}{rank}")
+            for file in FILES for rank in range(1, 9)
+        }
 
-    if x < border + tile_size:
-        pos.append("a")
-    elif x < 2 * tile_size + border:
-        pos.append("b")
-    elif x < 3 * tile_size + border:
-        pos.append("c")
-    elif x < 4 * tile_size + border:
-        pos.append("d")
-    elif x < 5 * tile_size + border:
-        pos.append("e")
-    elif x < 6 * tile_size + border:
-        pos.append("f")
-    elif x < 7 * tile_size + border:
-        pos.append("g")
-    elif x < 8 * tile_size + border:
-        pos.append("h")
-    else:
-        return False
+    def _square_rect(self, square):
+        """computes where a square is drawn"""
+        column = FILES.index(square[0])
+        row = 8 - int(square[1])
+        if self.flipped:
+            column, row = 7 - column, 7 - row
+        return pygame.Rect(self.rect.x + self.border + column * self.tile_size,
+                           self.rect.y + self.border + row * self.tile_size,
+                           self.piece_size, self.piece_size)
 
-    if y < tile_size + border:
-        pos.append("8")
-    elif y < 2 * tile_size + border:
-        pos.append("7")
-    elif y < 3 * tile_size + border:
-        pos.append("6")
-    elif y < 4 * tile_size + border:
-        pos.append("5")
-    elif y < 5 * tile_size + border:
-        pos.append("4")
-    elif y < 6 * tile_size + border:
-        pos.append("3")
-    elif y < 7 * tile_size + border:
-        pos.append("2")
-    elif y < 8 * tile_size + border:
-        pos.append("1")
-    else:
-        return False
+    def square_to_rect(self, square):
+        """
+        :param square: coordinates, ex. 'e4'
+        :return: pygame.Rect the square's piece is drawn in
+        """
+        return self.rects[square]
 
-    return "".join(pos)
+    def pixel_to_square(self, pixel):
+        """
+        :param pixel: point in the window, as tuple
+        :return: coordinates, ex. 'e4', or None if off the squares
+        """
+        column = int((pixel[0] - self.rect.x - self.border) // self.tile_size)
+        row = int((pixel[1] - self.rect.y - self.border) // self.tile_size)
+        if not (0 <= column < 8 and 0 <= row < 8):
+            return None
+        if self.flipped:
+            column, row = 7 - column, 7 - row
+        return f"{FILES[column]}{8 - row}"
 
 
 def greeting():
     print("Welcome to Chess!")
     print("Game data will persist upon exit.")
     print("Press 'esc' to quit, or 'c' to start a new game.")
+    print("Playing several games? Press 'tab' to switch between all boards "
+          "and one, or 1-9 to pick a board.")
+    print("Playing black? Press 'f' to flip the board.")
 
 
-def load_game():
+def load_game(path=".game_pickle"):
     # load a saved gave if it exists, else start new
     try:
-        dbfile = open(".game_pickle", "rb")
+        dbfile = open(path, "rb")
         chess = pickle.load(dbfile)
     except Exception:
         chess = Chess()
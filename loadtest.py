@@ -0,0 +1,206 @@
+"""
+Load test for the ChessPvP API: simulates many clients, each playing both
+sides of its own game, and reports request throughput and latency.
+Every client keeps one HTTP/1.1 connection open, like Server's session.
+
+Usage:
+    python loadtest.py                       start local_server.py and test it
+    python loadtest.py --clients 300 --duration 20
+    python loadtest.py --host http://127.0.0.1:8000/
+    python loadtest.py --compact             send moves in the wire.py format
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import sys
+import threading
+from time import perf_counter, time
+from urllib.parse import urlencode, urlparse
+
+from chess import Chess
+from perft import candidate_moves
+from wire import CONTENT_TYPE, encode_batch
+
+
+class Client:
+    """One simulated player with a keep-alive connection to the API"""
+    def __init__(self, host, game_id, rng, compact=False):
+        """
+        initialize the client and its local copy of the game
+        :param host: base URL of the API, ex. 'http://127.0.0.1:8000/'
+        :param game_id: the game this client plays
+        :param rng: random.Random for choosing moves
+        :param compact: send moves in the wire.py format instead of PATCH
+        """
+        url = urlparse(host)
+        self._conn = http.client.HTTPConnection(url.hostname, url.port,
+                                                timeout=30)
+        self._prefix = url.path.rstrip("/")
+        self._game_id = game_id
+        self._rng = rng
+        self._compact = compact
+        self._chess = Chess(creation=0)
+        self.latencies = {}  # "METHOD /path" -> list of seconds
+        self.errors = 0
+
+    def request(self, method, path, body=None, **params):
+        """
+        sends a request and times it
+        :param method: 'GET', 'PATCH', 'POST' or 'PUT'
+        :param path: endpoint, ex. '/game'
+        :param body: optional bytes in the wire.py format
+        :param params: query parameters, besides the game id
+        :return: the decoded JSON body, or None on an error status
+        """
+        query = urlencode({"id": self._game_id, **params})
+        headers = {"Content-Type": CONTENT_TYPE} if body is not None else {}
+        start = perf_counter()
+        self._conn.request(method, f"{self._prefix}{path}?{query}", body,
+                           headers)
+        res = self._conn.getresponse()
+        body = res.read()
+        self.latencies.setdefault(f"{method} {path}", []).append(
+            perf_counter() - start)
+        if res.status != 200:
+            self.errors += 1
+            return None
+        return json.loads(body)
+
+    def choose_move(self):
+        """
+        picks a random legal move for the side to play
+        :return: tuple of squares, or None if the game is over
+        """
+        moves = candidate_moves(self._chess)
+        self._rng.shuffle(moves)
+        for move in moves:
+            if self._chess.push(*move):
+                return move
+        return None
+
+    def play(self, deadline, max_turns):
+        """
+        plays games until the deadline: move, then read the game back as
+        the opponent's client would. Starts over when a game ends.
+        :param deadline: perf_counter() value to stop at
+        :param max_turns: length at which a game is abandoned and restarted
+        :return: nothing
+        """
+        self.request("PUT", "/game")
+        while perf_counter() < deadline:
+            move = None
+            if self._chess.get_turn() < max_turns:
+                move = self.choose_move()
+            if move is None:
+                self._chess = Chess(creation=0)
+                self.request("PUT", "/game")
+                continue
+            if self._compact:
+                self.request("POST", "/game/moves", encode_batch(
+                    self._chess.get_turn(), [move], time()))
+            else:
+                self.request("PATCH", "/game", turn=self._chess.get_turn(),
+                             time=time(), **{"from": move[0], "to": move[1]})
+            self.request("GET", "/game")
+        self._conn.close()
+
+
+def percentile(ordered, fraction):
+    """
+    :param ordered: sorted list of numbers
+    :param fraction: 0 to 1, ex. 0.99
+    :return: the value below which that fraction of the list falls
+    """
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _serve(ready):
+    """runs a local API in a child process, sending its port back"""
+    from local_server import make_server
+
+    server = make_server(port=0)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+def run(host, clients, duration, max_turns, seed=0, compact=False,
+        out=sys.stdout):
+    """
+    runs the load test and prints a report
+    :param host: base URL of the API
+    :param clients: number of simultaneous clients
+    :param duration: seconds to run for
+    :param max_turns: length at which games are restarted
+    :param seed: seed for the clients' move choices
+    :param compact: send moves in the wire.py format instead of PATCH
+    :param out: stream for the report
+    :return: dict of "METHOD /path" -> sorted latencies in seconds
+    """
+    players = [Client(host, f"load-{i}", random.Random(seed + i), compact)
+               for i in range(clients)]
+    start = perf_counter()
+    threads = [threading.Thread(target=player.play,
+                                args=(start + duration, max_turns))
+               for player in players]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+
+    latencies = {}
+    for player in players:
+        for endpoint, times in player.latencies.items():
+            latencies.setdefault(endpoint, []).extend(times)
+    errors = sum(player.errors for player in players)
+    total = sum(len(times) for times in latencies.values())
+
+    print(f"{clients} clients, {elapsed:.1f}s: {total} requests, "
+          f"{total / elapsed:.0f} req/s, {errors} errors", file=out)
+    for endpoint, times in sorted(latencies.items()):
+        times.sort()
+        print(f"  {endpoint:<18} {len(times):>8}  "
+              f"p50 {1000 * percentile(times, 0.50):7.1f} ms  "
+              f"p99 {1000 * percentile(times, 0.99):7.1f} ms  "
+              f"max {1000 * times[-1]:7.1f} ms", file=out)
+    return latencies
+
+
+def main(argv=None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", help="API to test (default: start a "
+                                       "local_server.py for the run)")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds to run for")
+    parser.add_argument("--max-turns", type=int, default=80,
+                        help="restart games that reach this many turns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compact", action="store_true",
+                        help="send moves as 16-bit codes to /game/moves")
+    args = parser.parse_args(argv)
+
+    server = None
+    host = args.host
+    if host is None:
+        # a separate process, so the server and clients don't share a GIL
+        ready = multiprocessing.Queue()
+        server = multiprocessing.Process(target=_serve, args=(ready,),
+                                         daemon=True)
+        server.start()
+        host = f"http://127.0.0.1:{ready.get()}/"
+
+    try:
+        run(host, args.clients, args.duration, args.max_turns, args.seed,
+            args.compact)
+    finally:
+        if server is not None:
+            server.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""
+A local stand-in for the ChessAPI, for playing and testing offline.
+Implements the same /game GET/PATCH/PUT contract as the hosted API, plus a
+/game/wait long-poll endpoint that answers as soon as the game changes and
+a /game/moves?since=N endpoint that returns every move after turn N.
+
+Any number of games can be played at once. Every endpoint takes an optional
+id parameter naming the game, ex. /game?id=club-3; without it the requests
+go to the 'default' game, so the hosted API's clients work unchanged.
+Moves are checked with the Chess engine and illegal ones are refused.
+GET /game sends an ETag and answers If-None-Match with a bodiless 304.
+GET /games?ids=a,b returns several games in one response, with an ETag.
+POST /game/moves takes a batch of moves in the compact format of wire.py.
+
+Usage:
+    python local_server.py [--host 127.0.0.1] [--port 8000]
+then set HOST=http://127.0.0.1:8000/ in .env
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, time
+from urllib.parse import parse_qs, urlparse
+
+from chess import Chess
+from pieces import QUEEN
+from wire import CONTENT_TYPE, WireError, decode_batch
+
+# longest a /game/wait request is held open, in seconds
+MAX_WAIT = 60.0
+DEFAULT_GAME = "default"
+
+
+class MoveRejected(Exception):
+    """Raised when a move is out of turn or illegal"""
+    pass
+
+
+class GameStore:
+    """Holds the state of a single game and wakes long-polls on changes"""
+    def __init__(self):
+        """initialize a new game"""
+        self._changed = threading.Condition()
+        self._start()
+
+    def _start(self):
+        """sets up a game with no moves"""
+        self._state = {"turn": 0, "from": None, "to": None, "time": time()}
+        self._created = self._state["time"]
+        self._moves = []
+        self._chess = Chess(creation=self._created)
+
+    def get(self):
+        """returns a copy of the current state"""
+        with self._changed:
+            return dict(self._state)
+
+    def moves_since(self, since):
+        """
+        returns every move played after a given turn
+        :param since: the last turn the client has, 0 for the whole game
+        :return: dict with the current 'turn' and 'time', the game's
+        'created' time and a list of 'moves', oldest first
+        """
+        with self._changed:
+            return {"turn": self._state["turn"],
+                    "time": self._state["time"],
+                    "created": self._created,
+                    "moves": [dict(m) for m in self._moves
+                              if m["turn"] > since]}
+
+    def move(self, turn, sq_from, sq_to, timestamp):
+        """
+        checks and records a move, then wakes every waiting client
+        :param turn: the turn count after the move
+        :param sq_from: origination
+        :param sq_to: destination
+        :param timestamp: the time of the move, as sent by the client
+        :return: the new state
+        """
+        return self.move_batch(turn, [(sq_from, sq_to, None)], timestamp)
+
+    def move_batch(self, first_turn, moves, timestamp):
+        """
+        checks and records a sequence of moves, then wakes every waiting
+        client. Either every move is played or none are. Moves already
+        recorded for their turn are skipped, so clients can safely resend.
+        :param first_turn: the turn count after the first move
+        :param moves: list of (sq_from, sq_to, promotion) tuples
+        :param timestamp: the time of the last move, as sent by the client
+        :return: the new state
+        """
+        with self._changed:
+            played = []
+            try:
+                for turn, (sq_from, sq_to, promotion) in \
+                        enumerate(moves, first_turn):
+                    if 0 < turn <= len(self._moves):
+                        recorded = self._moves[turn - 1]
+                        if (recorded["from"], recorded["to"]) == \
+                                (sq_from, sq_to):
+                            continue
+                    expected = self._chess.get_turn() + 1
+                    if turn != expected:
+                        raise MoveRejected(f"expected turn {expected}")
+                    if promotion not in (None, QUEEN):
+                        raise MoveRejected("pawns only promote to queens")
+                    if not self._chess.push(sq_from, sq_to):
+                        raise MoveRejected(f"illegal move {sq_from}{sq_to}")
+                    played.append({"turn": turn, "from": sq_from,
+                                   "to": sq_to, "time": timestamp})
+            except MoveRejected:
+                for _ in played:
+                    self._chess.pop()
+                raise
+
+            if played:
+                self._moves.extend(played)
+                self._state = dict(played[-1])
+                self._changed.notify_all()
+            return dict(self._state)
+
+    def reset(self):
+        """starts a new game and wakes every waiting client"""
+        with self._changed:
+            self._start()
+            self._changed.notify_all()
+            return dict(self._state)
+
+    def wait(self, turn, timestamp, timeout):
+        """
+        blocks until the game differs from what the client has seen
+        :param turn: the turn the client last saw
+        :param timestamp: the time the client last saw
+        :param timeout: seconds to wait before returning the unchanged state
+        :return: the current state
+        """
+        def changed():
+            return (self._state["turn"] != turn
+                    or self._state["time"] != timestamp)
+
+        with self._changed:
+            self._changed.wait_for(changed, timeout)
+            return dict(self._state)
+
+
+class GameRegistry:
+    """Holds every game on the server, keyed by id"""
+    def __init__(self):
+        """initialize with no games"""
+        self._games = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """returns the number of games"""
+        return len(self._games)
+
+    def get(self, game_id):
+        """
+        returns a game, creating it on first use
+        :param game_id: any string
+        :return: GameStore
+        """
+        with self._lock:
+            store = self._games.get(game_id)
+            if store is None:
+                store = self._games[game_id] = GameStore()
+            return store
+
+
+class APIServer(ThreadingHTTPServer):
+    """A threaded HTTP server holding a GameRegistry"""
+    daemon_threads = True
+    # room for many clients connecting at once, ex. from loadtest.py
+    request_queue_size = 256
+
+    def __init__(self, address):
+        """
+        binds the server and creates its registry
+        :param address: tuple of host and port
+        """
+        super().__init__(address, APIHandler)
+        self.games = GameRegistry()
+
+
+class APIHandler(BaseHTTPRequestHandler):
+    """Routes requests to the game named by the id parameter"""
+    protocol_version = "HTTP/1.1"
+    # send each response at once; Nagle's algorithm held small responses
+    # back until the client's delayed ACK, adding ~40 ms per request
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        """reads a game, or waits for it to change"""
+        path, params = self._parse()
+        if path == "/":
+            self._send({"message": "ChessPvP local API",
+                        "games": len(self.server.games)})
+        elif path == "/game":
+            state = self._store(params).get()
+            etag = f'"{state["turn"]}-{state["time"]!r}"'
+            if self.headers.get("If-None-Match") == etag:
+                self._send(None, 304, etag=etag)
+            else:
+                self._send(state, etag=etag)
+        elif path == "/games":
+            # several games at once, ex. /games?ids=a,b,c
+            ids = [i for i in params.get("ids", "").split(",") if i]
+            games = {i: self.server.games.get(i).get() for i in ids}
+            etag = '"' + ",".join(f'{g["turn"]}-{g["time"]!r}'
+                                  for g in games.values()) + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self._send(None, 304, etag=etag)
+            else:
+                self._send({"games": games}, etag=etag)
+        elif path == "/game/moves":
+            try:
+                since = int(params.get("since", 0))
+            except ValueError:
+                self._send({"detail": "invalid parameters"}, 400)
+                return
+            self._send(self._store(params).moves_since(since))
+        elif path == "/game/wait":
+            try:
+                turn = int(params.get("turn", -1))
+                timestamp = float(params.get("time", 0))
+                timeout = min(float(params.get("timeout", 25)), MAX_WAIT)
+            except ValueError:
+                self._send({"detail": "invalid parameters"}, 400)
+                return
+            self._send(self._store(params).wait(turn, timestamp, timeout))
+        else:
+            self._send({"detail": "Not Found"}, 404)
+
+    def do_PATCH(self):
+        """records a move"""
+        path, params = self._parse()
+        if path != "/game":
+            self._send({"detail": "Not Found"}, 404)
+            return
+        try:
+            state = self._store(params).move(int(params["turn"]),
+                                             params["from"], params["to"],
+                                             float(params["time"]))
+        except (KeyError, ValueError):
+            self._send({"detail": "invalid move"}, 400)
+            return
+        except MoveRejected as error:
+            self._send({"detail": str(error)}, 409)
+            return
+        self._send(state)
+
+    def do_POST(self):
+        """records a batch of moves sent in the compact wire format"""
+        path, params = self._parse()
+        if path != "/game/moves":
+            self._send({"detail": "Not Found"}, 404)
+            return
+        if self.headers.get("Content-Type") != CONTENT_TYPE:
+            self._send({"detail": f"expected {CONTENT_TYPE}"}, 415)
+            return
+        try:
+            first_turn, moves, timestamp = decode_batch(self.body)
+            state = self._store(params).move_batch(first_turn, moves,
+                                                   timestamp)
+        except WireError as error:
+            self._send({"detail": str(error)}, 400)
+            return
+        except MoveRejected as error:
+            self._send({"detail": str(error)}, 409)
+            return
+        self._send(state)
+
+    def do_PUT(self):
+        """starts a new game"""
+        path, params = self._parse()
+        if path != "/game":
+            self._send({"detail": "Not Found"}, 404)
+            return
+        self._send(self._store(params).reset())
+
+    def _store(self, params):
+        """
+        finds the game a request is for
+        :param params: the request's params
+        :return: GameStore
+        """
+        return self.server.games.get(params.get("id", DEFAULT_GAME))
+
+    def _parse(self):
+        """
+        reads the request body and splits the request target into a path
+        and single-valued params
+        :return: tuple of path and dict
+        """
+        self._started = perf_counter()
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length) if length else b""
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        return url.path.rstrip("/") or "/", params
+
+    def _send(self, body, status=200, etag=None):
+        """
+        writes a JSON response
+        :param body: anything json serializable, ignored for a 304
+        :param status: HTTP status code
+        :param etag: optional ETag header value
+        :return: nothing
+        """
+        data = b"" if status == 304 else json.dumps(body).encode()
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        # time spent handling the request, for clients measuring latency
+        duration = 1000 * (perf_counter() - self._started)
+        self.send_header("Server-Timing", f"app;dur={duration:.2f}")
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """keeps the console quiet; long-polls would flood it"""
+        pass
+
+
+def make_server(host="127.0.0.1", port=8000):
+    """
+    creates a server with no games yet. Call serve_forever() on the
+    result, or run it in a thread for tests.
+    :param host: interface to bind
+    :param port: port to bind, 0 for any free port
+    :return: APIServer
+    """
+    return APIServer((host, port))
+
+
+def main(argv=None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="local ChessPvP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port)
+    print(f"Serving on http://{args.host}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
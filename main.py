@@ -2,27 +2,344 @@
 Written by Lucas Jensen for BeaverHacks Spring 2022
 Last updated 10/8/2022
 The main file for playing chess with friends!
+
+Usage:
+    python main.py                  play the game named by GAME_ID, if any
+    python main.py club-1 club-2    watch and play several games at once
 """
-import os
+import math
 import pickle
 import sys
+from time import monotonic, perf_counter, time
 
 import pygame
 from dotenv import load_dotenv
 
+import assets
 from chess import Chess
-from server import Server
-from helpers import greeting, pix_to_coord, pos_to_pix, load_game
+from metrics import Metrics
+from server import MoveListener, NetworkWorker, Outbox, PollSchedule, Server
+from helpers import BoardLayout, greeting, load_game
+
+# posted by the network threads when a result is waiting, to wake the loop
+NETWORK_EVENT = pygame.event.custom_type()
+# longest the loop sleeps with nothing scheduled, in milliseconds
+IDLE_WAIT = 5000
+
+
+def wake():
+    """wakes the game loop from another thread"""
+    try:
+        pygame.event.post(pygame.event.Event(NETWORK_EVENT))
+    except pygame.error:
+        # the display has already been shut down
+        pass
+
+
+class Match:
+    """
+    One game being played: the local Chess object, its save file and its
+    queue of moves for the API. Network calls go through the Game's shared
+    worker, labelled with this game's id.
+    """
+    def __init__(self, game_id, server, network, metrics):
+        """
+        :param game_id: the API's id for the game, or None for the default
+        :param server: Server for the API. A copy bound to game_id is used
+        :param network: the shared NetworkWorker
+        :param metrics: the shared Metrics
+        """
+        self.game_id = game_id
+        suffix = f"-{game_id}" if game_id else ""
+        self.game_save = f".game_pickle{suffix}"
+        self.chess = load_game(self.game_save)
+        self.server = server.for_game(game_id) if game_id else server
+        self.network = network
+        self.metrics = metrics
+        # our moves waiting to reach the API, kept on disk while offline
+        self.outbox = Outbox(f".move_outbox{suffix}")
+        # when to check the API for this game, if it can't push
+        self.poll = PollSchedule()
+        # the color last played from this client; None while only watching
+        self.side = None
+        # cleared if the API turns out to have no move history endpoint
+        self.can_sync = True
+        # shown from black's side
+        self.flipped = False
+
+    def submit(self, kind, call, *args):
+        """
+        Runs a Server call on the shared worker, labelled with this game
+        :param kind: what the call is, ex. 'flush'
+        """
+        self.network.submit((kind, self.game_id), call, *args)
+
+    def save(self):
+        """saves the game locally"""
+        with open(self.game_save, "wb") as dbfile:
+            pickle.dump(self.chess, dbfile)
+
+    def result_message(self):
+        """
+        describes how the game ended
+        :return: a string, or None if the game is still going
+        """
+        state = self.chess.get_game_state()
+        if state == "CHECKMATE":
+            # the player who is to move has been mated
+            if self.chess.get_active_player() == "W":
+                return "Checkmate! Black wins"
+            return "Checkmate! White wins"
+        elif state == "STALEMATE":
+            return "Stalemate!"
+        return None
+
+    def announce_result(self):
+        """prints the result to the terminal if the last move ended the game"""
+        message = self.result_message()
+        if message:
+            if self.game_id:
+                message = f"{self.game_id}: {message}"
+            print(message)
+            print("Press 'c' to start a new game.")
+
+    def play_move(self, sq_from, sq_to):
+        """
+        Makes our move locally at once and queues it for the API
+        :param sq_from: origination
+        :param sq_to: destination
+        :return: bool, whether the move was valid
+        """
+        color = self.chess.get_active_player()
+        start = perf_counter()
+        played = self.chess.make_move(sq_from, sq_to)
+        applied = perf_counter() - start
+        self.metrics.observe("apply", applied)
+        if played:
+            self.metrics.event("move", game=self.game_id,
+                               turn=self.chess.get_turn(),
+                               apply_ms=round(1000 * applied, 2))
+            self.announce_result()
+            self.side = color
+            self.poll.moved(monotonic())
+
+            # refused moves don't change the game, so only played ones are
+            # sent. They are queued first, so they reach the API even if it
+            # is down right now
+            self.outbox.put(
+                self.chess.get_turn(),
+                {"from": sq_from, "to": sq_to},
+                self.chess.get_time(),
+            )
+            self.submit("flush", self.outbox.flush, self.server)
+        return played
+
+    def reset(self):
+        """clears the board to start a new game once the API confirms"""
+        self.outbox.clear()
+        self.submit("reset", self.server.reset)
+
+    def apply_api_state(self, api_state, via="poll"):
+        """
+        Brings the local game up to date with the API's game state
+        :param api_state: dict with 'turn', 'from', 'to' and 'time'
+        :param via: how the state arrived, 'push' or 'poll', for the metrics
+        :return: bool, whether the API's game differed from the local one
+        """
+        api_time = float(api_state["time"])
+        api_turn = int(api_state["turn"])
+
+        if api_time > self.chess.get_time():
+            if api_turn == 0:
+                # the game has been cleared
+                self.chess = Chess(creation=api_time)
+                return True
+            elif api_turn > self.chess.get_turn() + 1 and self.can_sync:
+                # more than one move was missed; fetch them all at once
+                self.sync()
+                return True
+            elif api_turn > self.chess.get_turn():
+                # the opponent has moved
+                if self.apply_opponent_move(api_state, via):
+                    self.announce_result()
+                return True
+        return False
+
+    def apply_opponent_move(self, entry, via):
+        """
+        Plays a move made by the opponent's client and records how long it
+        took to get here
+        :param entry: dict with 'turn', 'from', 'to' and 'time'
+        :param via: 'push', 'poll' or 'sync'
+        :return: bool, whether the move was valid
+        """
+        with self.metrics.time("apply"):
+            played = self.chess.make_move(entry["from"], entry["to"])
+        if played:
+            # the opponent's clock stamped the move, so this includes any
+            # skew between the two machines
+            seen = time() - float(entry["time"])
+            self.metrics.observe(f"seen via {via}", seen)
+            self.metrics.event("seen", game=self.game_id,
+                               turn=int(entry["turn"]), via=via,
+                               seen_ms=round(1000 * seen, 2))
+        return played
+
+    def sync(self, since=None):
+        """
+        Asks the API, in the background, for every move after a turn
+        :param since: the turn to sync from, defaults to the local turn
+        """
+        if since is None:
+            since = self.chess.get_turn()
+        self.submit("moves", self.fetch_moves, since, self.chess.get_turn())
+
+    def fetch_moves(self, since, turn=0):
+        """
+        Runs on the network worker: fetches the API's history along with
+        what was still in flight when it was asked for
+        :param since: the turn to fetch moves after
+        :param turn: the local turn count when the fetch was requested
+        :return: the result of Server.get_moves, with 'queued', the turn of
+        our last move not yet on the API (0 if none), and 'requested' set to
+        turn; or None if the API has no history
+        """
+        queued = self.outbox.last_turn()
+        history = self.server.get_moves(since)
+        if history is not None:
+            history = dict(history, queued=queued, requested=turn)
+        return history
+
+    def apply_moves(self, history):
+        """
+        Replays a batch of moves from the API onto the local game
+        :param history: dict with 'turn', 'created' and 'moves', as returned
+        by fetch_moves, or None if the API has no history
+        """
+        if history is None:
+            self.can_sync = False
+            return
+
+        created = float(history["created"])
+        if created > self.chess.get_time():
+            # the API has started a new game since this one was last played
+            self.chess = Chess(creation=created)
+            if history["moves"] and history["moves"][0]["turn"] != 1:
+                self.sync(since=0)
+                return
+        elif max(int(history["turn"]), history.get("queued", 0)) < \
+                history.get("requested", 0):
+            # moves we had when asking are neither on the API nor queued.
+            # Compared with the turn at the time of the request, not now:
+            # moves played or sent since then are not missing
+            print("The server's game is behind yours; the boards have "
+                  "diverged")
+
+        replayed = False
+        for entry in history["moves"]:
+            if entry["turn"] <= self.chess.get_turn():
+                continue
+            if entry["turn"] > self.chess.get_turn() + 1 or \
+                    not self.apply_opponent_move(entry, "sync"):
+                print(f"Could not replay turn {entry['turn']} from the "
+                      f"server; the boards have diverged")
+                break
+            replayed = True
+
+        if replayed:
+            self.announce_result()
+
+    def polled(self, now, changed):
+        """
+        Updates this game's poll schedule after a check with the API
+        :param now: monotonic() time of the check
+        :param changed: whether the API's game differed from the local one
+        """
+        our_turn = self.side == self.chess.get_active_player()
+        self.poll.polled(now, changed, our_turn)
+
+    def take_back(self, turn):
+        """
+        Undoes local moves the API doesn't have, back to a turn both agree
+        on. Moves made before the game was loaded can't be undone
+        :param turn: the turn count to go back to
+        """
+        while self.chess.get_turn() > turn and self.chess.get_history():
+            self.chess.pop()
+
+    def handle_result(self, kind, result):
+        """
+        Applies the result of a Server call made for this game
+        :param kind: what the call was, ex. 'moves'
+        :param result: what the call returned
+        """
+        if kind == "moves":
+            self.apply_moves(result)
+        elif kind == "rebuild":
+            if result is None:
+                # no history to replay: catch up from the API's last move
+                self.submit("game", self.server.get_game)
+            else:
+                self.chess = Chess(creation=float(result["created"]))
+                self.apply_moves(result)
+        elif kind == "game":
+            self.apply_api_state(result, "sync")
+            if int(result["turn"]) != self.chess.get_turn():
+                print("The server can't send its game's history; the "
+                      "boards have diverged")
+        elif kind == "flush" and result["conflict"]:
+            print("The server's game moved on without your last moves; "
+                  "reloading it")
+            self.take_back(result["diverged"])
+            self.submit("rebuild", self.fetch_moves, 0)
+        elif kind == "reset":
+            self.chess = Chess(creation=result["time"])
 
 
 class Game:
-    def __init__(self, chess: Chess):
+    def __init__(self, game_ids=()):
+        """
+        :param game_ids: ids of the games to show. With none, the single
+        game named by GAME_ID (or the API's default game) is played
+        """
         self.WIDTH, self.HEIGHT = 800, 800
         self.WIN = pygame.display.set_mode((self.WIDTH, self.HEIGHT), pygame.RESIZABLE)
-        self.BOARD = pygame.image.load(os.path.join("assets", "chess_board.png"))
-        self.chess = chess
-        self.game_save = ".game_pickle"
-        self.server = Server()
+        # decode every image once, in the display's pixel format
+        assets.preload()
+        # where the time goes: rendering, move application, round trips
+        self.metrics = Metrics(log_path=".move_log.jsonl",
+                               summary_path=".metrics.json")
+        self.server = Server(metrics=self.metrics)
+        # one worker serves every board
+        self.network = NetworkWorker(notify=wake)
+        self.matches = [Match(game_id, self.server, self.network, self.metrics)
+                        for game_id in (game_ids or [None])]
+        self.by_id = {match.game_id: match for match in self.matches}
+        self.active = self.matches[0]
+        # several boards are tiled; tab shows just the active one
+        self.tiled = len(self.matches) > 1
+        # a long-poll per game would be a loop per game, so pushes are only
+        # used for a single board; several boards share one batched poll
+        self.listener = None
+        if len(self.matches) == 1:
+            self.listener = MoveListener(self.active.server, notify=wake)
+        pygame.font.init()
+        self._fonts = {}
+        # what was last drawn, so each frame only redraws what changed
+        self._scene = None
+        self._drawn = {}  # game id -> (state, {square: sprite key})
+        self._drag_rect = None
+        self._layouts = {}  # (rect, flipped) -> BoardLayout
+
+    def get_font(self, size):
+        """
+        returns the font for a board size, creating it on first use
+        :param size: board width in pixels
+        """
+        height = int(size / 12)
+        if height not in self._fonts:
+            self._fonts[height] = pygame.font.SysFont(None, height)
+        return self._fonts[height]
 
     def scale_board(self):
         """
@@ -35,131 +352,351 @@ class Game:
         self.draw_window()
         pygame.display.set_mode((x, y))
 
+    def layout(self):
+        """
+        Places the boards in the window: a grid of equal squares when tiled,
+        or the active board alone. A BoardLayout is only built when a board
+        moves, is resized or is flipped.
+        :return: list of (match, BoardLayout)
+        """
+        width, height = self.WIN.get_size()
+        if not self.tiled:
+            size = min(width, height)
+            places = [(self.active, (0, 0, size, size))]
+        else:
+            columns = math.ceil(math.sqrt(len(self.matches)))
+            rows = math.ceil(len(self.matches) / columns)
+            size = min(width // columns, height // rows)
+            places = [((match, ((i % columns) * size, (i // columns) * size,
+                                size, size)))
+                      for i, match in enumerate(self.matches)]
+
+        layout = []
+        for match, rect in places:
+            key = (rect, match.flipped)
+            if key not in self._layouts:
+                self._layouts[key] = BoardLayout(rect, match.flipped)
+            layout.append((match, self._layouts[key]))
+        return layout
+
+    def board_at(self, coord):
+        """
+        finds the board under a point in the window
+        :param coord: pixel as tuple
+        :return: tuple of match and its BoardLayout, or (None, None)
+        """
+        for match, board in self.layout():
+            if board.rect.collidepoint(coord):
+                return match, board
+        return None, None
+
     def draw_window(self, sq_from=None):
         """
-        Draws the Pygame window
-        :param chess: the chess object that is being played
-        :param sq_from: square the piece is moving from
-        :param width: width of the Pygame window
-        :param height: height of the Pygame window
-        """
-        self.WIN.blit(
-            pygame.transform.scale(self.BOARD, (self.WIDTH, self.HEIGHT)), (0, 0)
-        )
-
-        for piece in self.chess.get_pieces():
-            if not piece.get_is_captured():
-                file_name = os.path.join("assets", piece.get_image())
-                image = pygame.image.load(file_name)
-                img_size = int((100 / 900) * self.WIDTH)
-                if sq_from:
-                    if sq_from == piece.get_position():
-                        mouse_pos = pygame.mouse.get_pos()
-                        mouse_pos = (mouse_pos[0] - 50, mouse_pos[1] - 50)
-                        self.WIN.blit(
-                            pygame.transform.scale(image, (img_size, img_size)),
-                            mouse_pos,
-                        )
-                    else:
-                        self.WIN.blit(
-                            pygame.transform.scale(image, (img_size, img_size)),
-                            (pos_to_pix(piece.get_position(), self.WIDTH)),
-                        )
-                else:
-                    self.WIN.blit(
-                        pygame.transform.scale(image, (img_size, img_size)),
-                        (pos_to_pix(piece.get_position(), self.WIDTH)),
-                    )
+        Draws the parts of the Pygame window that have changed since the
+        last frame: squares whose piece changed, the dragged piece's old and
+        new places, and whole boards whose result appeared or cleared.
+        Everything is redrawn after a resize or a change of layout.
+        :param sq_from: square the piece is moving from, on the active board
+        """
+        layout = self.layout()
+        scene = (self.WIN.get_size(), self.tiled, self.active.game_id,
+                 tuple(match.flipped for match in self.matches))
+        dirty = []
+        if scene != self._scene:
+            self._scene = scene
+            self._drawn = {}
+            self._layouts = {}
+            dirty.append(self.WIN.get_rect())
+            layout = self.layout()
+
+        for match, board in layout:
+            dragging = sq_from if match is self.active else None
+            state = (match.chess.get_hash(), dragging, match.result_message())
+            last_state, last_squares = self._drawn.get(match.game_id,
+                                                       (None, None))
+            if state == last_state:
+                continue
+            squares = self.visible_pieces(match, dragging)
+            if last_squares is None or state[2] != last_state[2]:
+                dirty.append(board.rect)
+            else:
+                # a pixel of margin covers the rounding of fractional places
+                dirty.extend(board.square_to_rect(square).inflate(2, 2)
+                             for square in squares.keys() | last_squares.keys()
+                             if squares.get(square) != last_squares.get(square))
+            self._drawn[match.game_id] = (state, squares)
+
+        drag = self.drag_sprite(sq_from, layout)
+        drag_rect = drag[1] if drag else None
+        if drag_rect != self._drag_rect:
+            dirty.extend(r for r in (self._drag_rect, drag_rect) if r)
+            self._drag_rect = drag_rect
 
-        pygame.display.update()
+        for area in dirty:
+            self.paint(area, layout, drag)
+        if dirty:
+            pygame.display.update(dirty)
 
         # redraw the window if it has been resized
         # w, h = pygame.display.get_surface().get_size()
         # if w != self.WIDTH and h != self.HEIGHT:
         #     self.scale_board()
 
+    @staticmethod
+    def visible_pieces(match, sq_from=None):
+        """
+        lists what is drawn on each square of a board
+        :param match: the game
+        :param sq_from: the square whose piece is being dragged, drawn empty
+        :return: dict of square -> (color, piece type code), as drawn
+        """
+        return {piece.get_position(): (piece.get_color(), piece.TYPE)
+                for piece in match.chess.get_pieces()
+                if not piece.get_is_captured()
+                and piece.get_position() != sq_from}
+
+    def drag_sprite(self, sq_from, layout):
+        """
+        finds the image and place of the piece being dragged
+        :param sq_from: the square it came from, or None
+        :param layout: the boards and their BoardLayouts
+        :return: tuple of image and pygame.Rect, or None if not dragging
+        """
+        piece = self.active.chess.get_piece_by_square(sq_from) \
+            if sq_from else None
+        if not piece:
+            return None
+        board = next(b for m, b in layout if m is self.active)
+        img_size = board.piece_size
+        image = assets.piece_image(piece.get_color(), piece.TYPE, img_size)
+        mouse_x, mouse_y = pygame.mouse.get_pos()
+        return image, pygame.Rect(mouse_x - img_size // 2,
+                                  mouse_y - img_size // 2, img_size, img_size)
+
+    def paint(self, area, layout, drag=None):
+        """
+        Redraws everything inside one part of the window. Drawing is
+        clipped to it, so only the blits that touch it do any work.
+        :param area: pygame.Rect to redraw
+        :param layout: the boards and their BoardLayouts
+        :param drag: the dragged piece's image and rect, or None
+        """
+        self.WIN.set_clip(area)
+        self.WIN.fill((0, 0, 0), area)
+        for match, board in layout:
+            rect = board.rect
+            if not rect.colliderect(area):
+                continue
+            self.WIN.blit(assets.scaled(assets.BOARD_IMAGE, rect.size), rect)
+            for square, (color, kind) in self._drawn[match.game_id][1].items():
+                place = board.square_to_rect(square)
+                if area.colliderect(place):
+                    self.WIN.blit(assets.piece_image(color, kind,
+                                                     board.piece_size), place)
+            if match.chess.get_game_state() in ("CHECKMATE", "STALEMATE"):
+                self.draw_result(match, rect)
+            if self.tiled and match is self.active:
+                pygame.draw.rect(self.WIN, (255, 215, 0), rect, 3)
+
+        if drag and area.colliderect(drag[1]):
+            self.WIN.blit(*drag)
+        self.WIN.set_clip(None)
+
+    def draw_result(self, match, rect):
+        """
+        Draws the result of a finished game over its board
+        """
+        font = self.get_font(rect.width)
+        text = font.render(match.result_message(), True, (255, 255, 255))
+        text_rect = text.get_rect(center=rect.center)
+        backdrop = pygame.Surface(text_rect.inflate(40, 20).size,
+                                  pygame.SRCALPHA)
+        backdrop.fill((0, 0, 0, 180))
+        self.WIN.blit(backdrop, text_rect.inflate(40, 20))
+        self.WIN.blit(text, text_rect)
+
+    def handle_network_results(self):
+        """
+        Applies the results of Server calls that finished in the background
+        """
+        for (kind, game_id), result, error in self.network.poll():
+            if error:
+                print(f"Could not reach the server ({kind}): {error}")
+                if kind == "games":
+                    self.games_polled({})
+            elif kind == "games":
+                # None means the API answered 304: nothing has changed
+                self.games_polled(result or {})
+            else:
+                self.by_id[game_id].handle_result(kind, result)
+
+    def games_polled(self, states):
+        """
+        Applies the result of a poll to every board. Each board's schedule
+        moves on only if it was due or its game changed, so one busy game
+        doesn't slow the checks of the others
+        :param states: {game_id: state} for the games that changed
+        """
+        now = monotonic()
+        for match in self.matches:
+            state = states.get(match.game_id)
+            changed = state is not None and match.apply_api_state(state)
+            if changed or match.poll.due(now):
+                match.polled(now, changed)
+
+    def poll_due(self, now):
+        """returns whether any board's poll schedule is due"""
+        return any(match.poll.due(now) for match in self.matches)
+
+    def poll_games(self):
+        """
+        Asks the API for every board's game in one call, in the background
+        :return: {game_id: state}, or None if nothing has changed
+        """
+        if self.matches[0].game_id is None:
+            # the single default game
+            state = self.server.get_game(if_changed=True)
+            return None if state is None else {None: state}
+        return self.server.get_games([m.game_id for m in self.matches],
+                                     if_changed=True)
+
+    def polling(self):
+        """returns whether games are checked by polling rather than pushed"""
+        return self.listener is None or not self.listener.supported
+
+    def wait_time(self, making_move):
+        """
+        finds how long the loop may sleep before something needs doing.
+        Input and network results wake it sooner by posting events.
+        :param making_move: whether a piece is being dragged. Results are
+        only applied between moves
+        :return: milliseconds, 0 if there is something to do now, otherwise
+        at least 1
+        """
+        if making_move:
+            return IDLE_WAIT
+        if not self.network.results.empty() or (
+                not self.polling() and not self.listener.states.empty()):
+            return 0
+
+        deadlines = []
+        if not self.network.pending():
+            # while a call is running its result will wake the loop; after
+            # that, the next poll or retry decides
+            if self.polling():
+                deadlines.extend(match.poll.next_at()
+                                 for match in self.matches)
+            deadlines.extend(match.outbox.next_retry()
+                             for match in self.matches if len(match.outbox))
+        if not deadlines:
+            return IDLE_WAIT
+        wait = int(1000 * (min(deadlines) - monotonic())) + 1
+        return max(0, min(wait, IDLE_WAIT))
+
     def play(self):
         """
-        The main method for running Chess with Pygame
+        The main method for running Chess with Pygame. The loop sleeps
+        until there is input, a network result, or a scheduled check
         """
+        # opponent moves are pushed by the listener as soon as they happen;
+        # polling, on an adaptive schedule, is used for several boards or
+        # if the API can't push
+        if self.listener is not None:
+            self.listener.start()
+        # send moves made offline, then catch up on anything played while
+        # this client was closed
+        for match in self.matches:
+            if len(match.outbox):
+                match.submit("flush", match.outbox.flush, match.server)
+            match.sync()
+
         making_move = False
-        loop_count = 0  # only make get requests on certain iterations
         run = True
         move = {"sq_from": None, "sq_to": None}
+        board = None  # the BoardLayout of the board being moved on
 
         while run:
-            # the main loop for running the game
-            loop_count %= 30  # no need to exceed 30
+            # the main loop for running the game; at most 30 frames a second
             clock.tick(30)
-            x, y = self.WIN.get_size()
-            x = max(x, y)
-            y = max(x, y)
-            width = x
-            # these numbers come from the original file dimensions
-            border = (5 / 90) * width
-            tile_size = (1 / 9) * width
-
-            if loop_count == 0 and not making_move:
-                # check with API every time loop counter resets
-                api_state = self.server.get_game()
-                api_time = float(api_state["time"])
-                api_turn = int(api_state["turn"])
-
-                if api_time > self.chess.get_time():
-                    if api_turn == 0:
-                        # the game has been cleared
-                        self.chess = Chess(creation=api_time)
-                    elif api_turn > self.chess.get_turn():
-                        # the opponent has moved
-                        self.chess.make_move(api_state["from"], api_state["to"])
+            # pygame 2.1.2 treats event.wait(0) as "wait forever", so it is
+            # only called when there is time to sleep
+            wait = self.wait_time(making_move)
+            events = [pygame.event.wait(wait)] if wait > 0 else []
+            events.extend(pygame.event.get())
+
+            if not making_move:
+                if not self.polling():
+                    # apply whatever the listener has pushed since last frame
+                    while not self.listener.states.empty():
+                        self.active.apply_api_state(
+                            self.listener.states.get(), "push"
+                        )
+                elif self.poll_due(monotonic()) and not self.network.pending():
+                    # check with API when the first board's schedule says
+                    self.network.submit(("games", None), self.poll_games)
+
+                for match in self.matches:
+                    if match.outbox.due(monotonic()) and \
+                            not self.network.pending():
+                        # moves made while the API was unreachable
+                        match.submit("flush", match.outbox.flush,
+                                     match.server)
+
+                # network calls finish in the background; pick up results
+                self.handle_network_results()
 
             # get user input
-            for event in pygame.event.get():
+            for event in events:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
-                        # save the game locally and quit
-                        dbfile = open(self.game_save, "wb")
-                        pickle.dump(self.chess, dbfile)
+                        # save the games locally and quit
+                        for match in self.matches:
+                            match.save()
                         run = False
                     elif event.key == pygame.K_c:
-                        # clears the board to start a new game
-                        creation = self.server.reset()["time"]
-                        self.chess = Chess(creation=creation)
+                        self.active.reset()
+                    elif event.key == pygame.K_TAB and len(self.matches) > 1:
+                        self.tiled = not self.tiled
+                    elif pygame.K_1 <= event.key <= pygame.K_9:
+                        index = event.key - pygame.K_1
+                        if index < len(self.matches):
+                            self.active = self.matches[index]
+                    elif event.key == pygame.K_f:
+                        self.active.flipped = not self.active.flipped
 
                 elif event.type == pygame.QUIT:
                     run = False
 
+                elif event.type == pygame.VIDEORESIZE:
+                    # the scaled images were made for the old size
+                    assets.invalidate()
+
+                elif event.type == pygame.VIDEOEXPOSE:
+                    # the window was uncovered; only a full redraw repairs it
+                    self._scene = None
+
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     # verifies there isn't a lingering value in 'sq_to' from a
                     # random click
                     move["sq_to"] = None
 
                     coord = pygame.mouse.get_pos()
-                    if (
-                        border < coord[0] < width - border
-                        and border < coord[1] < width - border
-                    ):
-                        move["sq_from"] = pix_to_coord(coord, border, tile_size)  # type: ignore
+                    match, board = self.board_at(coord)
+                    if match is not None:
+                        # clicking a board makes it the active one
+                        self.active = match
+                        move["sq_from"] = board.pixel_to_square(coord)
 
                     making_move = True
 
                 elif event.type == pygame.MOUSEBUTTONUP:
-                    coord = pygame.mouse.get_pos()
-                    if (
-                        border < coord[0] < width - border
-                        and border < coord[1] < width - border
-                    ):
-                        move["sq_to"] = pix_to_coord(coord, border, tile_size)  # type: ignore
+                    if board is not None:
+                        move["sq_to"] = board.pixel_to_square(
+                            pygame.mouse.get_pos())
 
                 if move["sq_from"] and move["sq_to"]:
                     # make the actual move
-                    self.chess.make_move(move["sq_from"], move["sq_to"])
-
-                    self.server.make_move(
-                        self.chess.get_turn(),
-                        {"from": move["sq_from"], "to": move["sq_to"]},
-                        self.chess.get_time(),
-                    )
+                    self.active.play_move(move["sq_from"], move["sq_to"])
 
                     # reset
                     move = {"sq_from": None, "sq_to": None}
@@ -167,13 +704,21 @@ class Game:
                     making_move = False
 
             # update window
-            if move["sq_from"]:
-                self.draw_window(sq_from=move["sq_from"])
-            else:
-                self.draw_window()
-
-            loop_count += 1
+            with self.metrics.time("frame"):
+                if move["sq_from"]:
+                    self.draw_window(sq_from=move["sq_from"])
+                else:
+                    self.draw_window()
 
+        if self.listener is not None:
+            self.listener.stop()
+        self.network.shutdown(wait=False)
+        for endpoint, stats in self.server.get_latency_stats().items():
+            print(f"{endpoint}: {stats['count']} requests, "
+                  f"{stats['mean_ms']:.0f} ms mean, "
+                  f"{stats['max_ms']:.0f} ms max, {stats['errors']} errors")
+        print(f"Timings saved to {self.metrics.export()}")
+        self.metrics.close()
         pygame.quit()
         sys.exit()
 
@@ -181,5 +726,5 @@ class Game:
 if __name__ == "__main__":
     greeting()
     clock = pygame.time.Clock()
-    game = Game(chess=load_game())
+    game = Game(game_ids=sys.argv[1:])
     game.play()
@@ -0,0 +1,174 @@
+"""
+Timing instrumentation for finding where lag comes from. Durations are
+kept in fixed-bucket histograms by name, ex. 'apply' or 'http GET /game',
+and per-move events are appended to a JSON lines log as they happen.
+At exit, export() writes every histogram to a JSON file.
+"""
+import json
+import threading
+from contextlib import contextmanager
+from os import replace
+from time import perf_counter, time
+
+# upper bounds of the histogram buckets, in milliseconds. A final bucket
+# holds everything slower
+BOUNDS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+             10000)
+
+
+class Histogram:
+    """Counts durations in fixed buckets, with running totals"""
+    def __init__(self):
+        """initialize with every bucket empty"""
+        self._buckets = [0] * (len(BOUNDS_MS) + 1)
+        self._count = 0
+        self._total = 0.0
+        self._min = float("inf")
+        self._max = 0.0
+
+    def __len__(self):
+        """returns the number of durations recorded"""
+        return self._count
+
+    def record(self, seconds):
+        """
+        adds a duration
+        :param seconds: float
+        :return: nothing
+        """
+        ms = 1000 * seconds
+        index = 0
+        while index < len(BOUNDS_MS) and ms > BOUNDS_MS[index]:
+            index += 1
+        self._buckets[index] += 1
+        self._count += 1
+        self._total += ms
+        self._min = min(self._min, ms)
+        self._max = max(self._max, ms)
+
+    def percentile(self, fraction):
+        """
+        estimates a percentile as the upper bound of its bucket
+        :param fraction: 0 to 1, ex. 0.99
+        :return: milliseconds, or 0.0 if nothing has been recorded
+        """
+        if not self._count:
+            return 0.0
+        rank = fraction * self._count
+        seen = 0
+        for index, count in enumerate(self._buckets):
+            seen += count
+            if count and seen >= rank:
+                if index < len(BOUNDS_MS):
+                    return min(float(BOUNDS_MS[index]), self._max)
+                return self._max
+        return self._max
+
+    def as_dict(self):
+        """returns the totals, estimated percentiles and bucket counts"""
+        return {
+            "count": self._count,
+            "mean_ms": self._total / self._count if self._count else 0.0,
+            "min_ms": self._min if self._count else 0.0,
+            "max_ms": self._max,
+            "p50_ms": self.percentile(0.50),
+            "p90_ms": self.percentile(0.90),
+            "p99_ms": self.percentile(0.99),
+            "buckets": {f"<={bound}": count for bound, count
+                        in zip(BOUNDS_MS + ("inf",), self._buckets)},
+        }
+
+
+class Metrics:
+    """
+    Named histograms and an event log, safe to use from the game loop and
+    the network threads at once
+    """
+    def __init__(self, log_path=None, summary_path=None,
+                 max_log_bytes=1 << 20):
+        """
+        initialize with no measurements
+        :param log_path: optional JSON lines file that events are appended
+        to as they happen
+        :param summary_path: optional default file for export()
+        :param max_log_bytes: once the event log grows past this, it is
+        moved to log_path + '.1', replacing the one before, and started
+        again, so at most about twice this is kept on disk
+        """
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._summary_path = summary_path
+        self._log_path = log_path
+        self._max_log_bytes = max_log_bytes
+        self._log = open(log_path, "a") if log_path else None
+
+    def observe(self, name, seconds):
+        """
+        records a duration
+        :param name: the histogram to add it to, created on first use
+        :param seconds: float
+        :return: nothing
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def time(self, name):
+        """
+        times the body of a with statement
+        :param name: the histogram to add the duration to
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start)
+
+    def event(self, kind, **fields):
+        """
+        appends one line to the event log, stamped with the wall time
+        :param kind: what happened, ex. 'move' or 'ack'
+        :param fields: anything json serializable
+        :return: nothing
+        """
+        if self._log is None:
+            return
+        line = json.dumps({"event": kind, "at": time(), **fields})
+        with self._lock:
+            if self._log is None:
+                return
+            self._log.write(line + "\n")
+            self._log.flush()
+            if self._log.tell() > self._max_log_bytes:
+                self._log.close()
+                replace(self._log_path, self._log_path + ".1")
+                self._log = open(self._log_path, "w")
+
+    def summary(self):
+        """returns a dict of histogram name -> Histogram.as_dict()"""
+        with self._lock:
+            return {name: histogram.as_dict()
+                    for name, histogram in sorted(self._histograms.items())}
+
+    def export(self, path=None):
+        """
+        writes the summary to a JSON file
+        :param path: defaults to the summary_path given at creation
+        :return: the path written, or None if there was nowhere to write
+        """
+        path = path or self._summary_path
+        if path is None:
+            return None
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+        return path
+
+    def close(self):
+        """closes the event log"""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
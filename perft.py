@@ -0,0 +1,197 @@
+"""
+Perft: counts the leaf nodes of the legal move tree to a fixed depth.
+Used as a move generation benchmark and as a correctness check against
+published node counts.
+
+Usage:
+    python perft.py                     run the suite to each position's depth
+    python perft.py --depth 4 --workers 4
+    python perft.py --fen "8/8/8/8/8/8/8/K6k w - - 0 1" --depth 3 --divide
+"""
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from chess import Chess
+from zobrist import TranspositionTable
+
+START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+# positions whose legal moves Chess caches, so pop() can restore them. A
+# small table is enough, as pop() returns to a position just left
+MOVE_CACHE = 1 << 10
+
+# (name, FEN, published node counts by depth). Castling, en passant and
+# under-promotion are not implemented, so only the depths those rules do
+# not reach are listed.
+POSITIONS = [
+    ("start", START, [20, 400, 8902, 197281]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1"
+     " w kq - 0 1", [6]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP"
+     "/R4RK1 w - - 0 10", [46, 2079]),
+]
+
+
+def candidate_moves(chess):
+    """
+    lists every (sq_from, sq_to) pair the active player's pieces can try.
+    Moves that leave the mover in check are rejected later by push().
+    :param chess: Chess object
+    :return: list of tuples
+    """
+    player = chess.get_active_player()
+    return [
+        (piece.get_position(), move)
+        for piece in chess.get_pieces()
+        if piece.get_position() is not None and piece.get_color() == player
+        for move in piece.get_legal_moves()
+    ]
+
+
+def perft(chess, depth, table=None):
+    """
+    counts the legal move sequences of a given length
+    :param chess: Chess object. It is left in its original position
+    :param depth: number of half-moves
+    :param table: optional TranspositionTable to reuse subtree counts
+    :return: number of leaf nodes
+    """
+    if depth == 0:
+        return 1
+
+    if table is not None:
+        cached = table.get(chess.get_hash())
+        if cached is not None and cached[0] == depth:
+            return cached[1]
+
+    nodes = 0
+    for sq_from, sq_to in candidate_moves(chess):
+        if chess.push(sq_from, sq_to):
+            if depth == 1:
+                nodes += 1
+            else:
+                nodes += perft(chess, depth - 1, table)
+            chess.pop()
+
+    if table is not None:
+        table.store(chess.get_hash(), (depth, nodes), depth)
+
+    return nodes
+
+
+def _perft_after(chess, move, depth, hashed=False):
+    """
+    counts the leaves below a single root move, then undoes it. Also runs
+    in worker processes, which receive a pickled copy of the game
+    :param chess: Chess object
+    :param move: (sq_from, sq_to) root move, already known to be legal
+    :param depth: remaining depth below the root move
+    :param hashed: reuse subtree counts through a transposition table
+    :return: tuple of the move and its node count
+    """
+    table = TranspositionTable(1 << 18) if hashed else None
+    chess.push(*move)
+    nodes = perft(chess, depth, table)
+    chess.pop()
+    return move, nodes
+
+
+def divide(chess, depth, workers=1, hashed=False):
+    """
+    counts the leaves below each root move, optionally in parallel
+    :param chess: Chess object
+    :param depth: number of half-moves, at least 1
+    :param workers: number of processes. 1 runs everything in this process
+    :param hashed: reuse subtree counts through a transposition table
+    :return: dict of (sq_from, sq_to) -> node count
+    """
+    roots = []
+    for move in candidate_moves(chess):
+        if chess.push(*move):
+            chess.pop()
+            roots.append(move)
+
+    if workers <= 1:
+        return dict(_perft_after(chess, move, depth - 1, hashed)
+                    for move in roots)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_perft_after, chess, move, depth - 1, hashed)
+                   for move in roots]
+        return dict(future.result() for future in futures)
+
+
+def run_suite(max_depth=None, workers=1, bitboard=False, hashed=False,
+              out=sys.stdout):
+    """
+    runs perft on every test position and reports counts and speed
+    :param max_depth: optional cap on the depth searched per position
+    :param workers: number of processes to split root moves across
+    :param bitboard: use the bitboard move generator
+    :param hashed: reuse subtree counts through a transposition table
+    :param out: stream for the report
+    :return: bool, whether every count matched
+    """
+    passed = True
+    for name, fen, expected in POSITIONS:
+        depths = len(expected) if max_depth is None else min(max_depth,
+                                                             len(expected))
+        for depth in range(1, depths + 1):
+            chess = Chess(creation=0, bitboard=bitboard, fen=fen,
+                          table_size=MOVE_CACHE)
+            start = perf_counter()
+            nodes = sum(divide(chess, depth, workers, hashed).values())
+            elapsed = perf_counter() - start
+            ok = nodes == expected[depth - 1]
+            passed = passed and ok
+            print(f"{name:<12} depth {depth}  {nodes:>9} nodes  "
+                  f"{elapsed:8.2f}s  {nodes / elapsed:>9.0f} nps  "
+                  f"{'ok' if ok else f'FAIL expected {expected[depth - 1]}'}",
+                  file=out)
+
+    return passed
+
+
+def main(argv=None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depth", type=int,
+                        help="search depth (default: each position's full "
+                             "suite depth, or 3 with --fen)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes to split root moves across")
+    parser.add_argument("--bitboard", action="store_true",
+                        help="use the bitboard move generator")
+    parser.add_argument("--hash", action="store_true",
+                        help="reuse subtree counts through a transposition "
+                             "table")
+    parser.add_argument("--fen", help="count a single position instead of "
+                                      "running the suite")
+    parser.add_argument("--divide", action="store_true",
+                        help="print the node count below each root move")
+    args = parser.parse_args(argv)
+
+    if args.fen is None and not args.divide:
+        return 0 if run_suite(args.depth, args.workers, args.bitboard,
+                             args.hash) else 1
+
+    depth = args.depth or 3
+    chess = Chess(creation=0, bitboard=args.bitboard, fen=args.fen or START,
+                  table_size=MOVE_CACHE)
+    start = perf_counter()
+    counts = divide(chess, depth, args.workers, args.hash)
+    elapsed = perf_counter() - start
+    if args.divide:
+        for (sq_from, sq_to), nodes in sorted(counts.items()):
+            print(f"{sq_from}{sq_to}: {nodes}")
+    nodes = sum(counts.values())
+    print(f"depth {depth}: {nodes} nodes in {elapsed:.2f}s "
+          f"({nodes / elapsed:.0f} nps)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,8 @@ Written by Lucas Jensen
 Last updated 3/24/2022
 A Piece parent class and various piece-specific classes that inherit from Piece
 """
-import os
+# small integer codes for each piece type, used for fast type dispatch
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
 
 
 class Piece:
@@ -11,17 +12,48 @@ class Piece:
     A parent class representing a generic chess piece.  Specific classes for each piece
     will inherit from this class.
     """
+    # per-instance state lives in slots; everything shared by a piece type
+    # is a class attribute set by the subclasses
+    __slots__ = ('_color', '_position', '_is_captured', '_has_moved',
+                 '_legal_moves', '_targets', '_board')
+    TYPE = None
+    _sprite = None
+    _piece_type = None
+    _images = {'W': None, 'B': None}
+
     def __init__(self, color, position):
         """A generic class to represent a chess piece. Specific pieces inherit from this parent class"""
         self._color = color  # should be 'W' or 'B'
         self._position = position
         self._is_captured = False
-        self._sprite = None
         self._has_moved = False
-        self._piece_type = None
-        self._image = None
         self._legal_moves = None
         self._targets = None
+        self._board = None  # the Board whose square index tracks this piece
+
+    def __setstate__(self, state):
+        """
+        restores a pickled piece. Saves made before pieces used slots pickle
+        a plain dict that also holds the class level attributes
+        :param state: a dict, or a (dict, slots dict) tuple
+        :return: nothing
+        """
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        self._board = None
+        for name, value in state.items():
+            if name not in ('_sprite', '_piece_type', '_image'):
+                setattr(self, name, value)
+
+    def set_board(self, board):
+        """
+        registers the piece with a board's square index
+        :param board: Board object, or None to detach
+        :return: nothing
+        """
+        self._board = board
+        if board is not None and self._position is not None:
+            board.relocate(self, None, self._position)
 
     def get_targets(self):
         """returns a list of potential targets"""
@@ -37,24 +69,31 @@ class Piece:
 
     def get_image(self):
         """returns the filepath of the piece's corresponding image"""
-        return self._image
+        return self._images[self._color]
 
     def get_legal_moves(self):
         """returns a list of legal moves"""
         return self._legal_moves
 
-    def set_is_captured(self):
-        """sets capture status to True and position to None"""
-        self._is_captured = True
-        self._position = None
+    def set_is_captured(self, status=True):
+        """
+        sets capture status, clearing the position when captured
+        :param status: True, or False to put a piece back in play
+        :return: nothing
+        """
+        self._is_captured = status
+        if status:
+            if self._board is not None:
+                self._board.relocate(self, self._position, None)
+            self._position = None
 
     def get_has_moved(self):
         """returns whether the piece has moved"""
         return self._has_moved
 
-    def set_has_moved(self):
-        """sets self._has_moved to True"""
-        self._has_moved = True
+    def set_has_moved(self, status=True):
+        """sets self._has_moved, True unless a move is being taken back"""
+        self._has_moved = status
 
     def get_piece_type(self):
         """returns the piece type"""
@@ -70,6 +109,8 @@ class Piece:
 
     def set_position(self, position):
         """sets the piece's position"""
+        if self._board is not None:
+            self._board.relocate(self, self._position, position)
         self._position = position
 
     def get_color(self):
@@ -83,57 +124,60 @@ class Piece:
 
 class Pawn(Piece):
     """Represents a Pawn in Chess. Inherits from the generic Piece class"""
-    def __init__(self, color, position):
-        super().__init__(color, position)
-        self._sprite = 'P'
-        self._piece_type = 'Pawn'
-        self._image = os.path.join(f"{letter_to_color(self.get_color())}_{self._piece_type.lower()}.png")
+    __slots__ = ()
+    TYPE = PAWN
+    _sprite = 'P'
+    _piece_type = 'Pawn'
+    _images = {'W': "white_pawn.png", 'B': "black_pawn.png"}
 
 
 class Rook(Piece):
     """Represents a Pawn in Chess. Inherits from the generic Piece class"""
-    def __init__(self, color, position):
-        super().__init__(color, position)
-        self._sprite = 'R'
-        self._piece_type = 'Rook'
-        self._image = os.path.join(f"{letter_to_color(self.get_color())}_{self._piece_type.lower()}.png")
+    __slots__ = ()
+    TYPE = ROOK
+    _sprite = 'R'
+    _piece_type = 'Rook'
+    _images = {'W': "white_rook.png", 'B': "black_rook.png"}
 
 
 class Bishop(Piece):
     """Represents a Pawn in Chess. Inherits from the generic Piece class"""
-    def __init__(self, color, position):
-        super().__init__(color, position)
-        self._sprite = 'B'
-        self._piece_type = 'Bishop'
-        self._image = os.path.join(f"{letter_to_color(self.get_color())}_{self._piece_type.lower()}.png")
+    __slots__ = ()
+    TYPE = BISHOP
+    _sprite = 'B'
+    _piece_type = 'Bishop'
+    _images = {'W': "white_bishop.png", 'B': "black_bishop.png"}
 
 
 class Knight(Piece):
     """Represents a Pawn in Chess. Inherits from the generic Piece class"""
-    def __init__(self, color, position):
-        super().__init__(color, position)
-        self._sprite = 'H'  # H for horse, as K is taken by King
-        self._piece_type = 'Knight'
-        self._image = os.path.join(f"{letter_to_color(self.get_color())}_{self._piece_type.lower()}.png")
+    __slots__ = ()
+    TYPE = KNIGHT
+    _sprite = 'H'  # H for horse, as K is taken by King
+    _piece_type = 'Knight'
+    _images = {'W': "white_knight.png", 'B': "black_knight.png"}
 
 
 class Queen(Piece):
     """Represents a Pawn in Chess. Inherits from the generic Piece class"""
-    def __init__(self, color, position):
-        super().__init__(color, position)
-        self._sprite = 'Q'
-        self._piece_type = 'Queen'
-        self._image = os.path.join(f"{letter_to_color(self.get_color())}_{self._piece_type.lower()}.png")
+    __slots__ = ()
+    TYPE = QUEEN
+    _sprite = 'Q'
+    _piece_type = 'Queen'
+    _images = {'W': "white_queen.png", 'B': "black_queen.png"}
 
 
 class King(Piece):
     """Represents a Pawn in Chess. Inherits from the generic Piece class"""
+    __slots__ = ('_check',)
+    TYPE = KING
+    _sprite = 'K'
+    _piece_type = 'King'
+    _images = {'W': "white_king.png", 'B': "black_king.png"}
+
     def __init__(self, color, position):
         super().__init__(color, position)
-        self._sprite = 'K'
-        self._piece_type = 'King'
         self._check = False
-        self._image = os.path.join(f"{letter_to_color(self.get_color())}_{self._piece_type.lower()}.png")
 
     def get_check(self):
         """returns the king's check status"""
@@ -148,14 +192,6 @@ class King(Piece):
         self._check = status
 
 
-def letter_to_color(char):
-    """converts 'W' or 'B' into 'white' or 'black'"""
-    if char == 'B':
-        return "black"
-    else:
-        return "white"
-
-
 if __name__ == "__main__":
     print(Pawn('W', 'a2').get_image())
     print(King('B', 'd8').get_image())
@@ -1,20 +1,146 @@
+import copy
 import json
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from os import replace
+from time import monotonic, perf_counter, time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
 import requests
 from dotenv import load_dotenv
 from os import getenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import Metrics
+from wire import CONTENT_TYPE, encode_batch
 
 load_dotenv(override=True)
 
 
-class Server:
+class LatencyStats:
+    """Running request latency figures for one endpoint, in seconds"""
+
     def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def record(self, seconds: float, ok=True) -> None:
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": 1000 * self.total / self.count if self.count else 0.0,
+            "min_ms": 1000 * self.min if self.count else 0.0,
+            "max_ms": 1000 * self.max,
+        }
+
+
+class Server:
+    def __init__(
+        self,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        game_id: Optional[str] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
         self.HOST: str = getenv("HOST")  # type: ignore
+        # which game to play on APIs that host several, ex. local_server.py
+        self.game_id = game_id or getenv("GAME_ID")
+        # send moves in the compact format of wire.py until the API
+        # turns out not to support it
+        self.compact = True
+        # each setting can also come from .env, ex. READ_TIMEOUT=5
+        self.connect_timeout = _setting(connect_timeout, "CONNECT_TIMEOUT", 3.05)
+        self.read_timeout = _setting(read_timeout, "READ_TIMEOUT", 10.0)
+        retries = int(_setting(retries, "RETRIES", 3))
+        backoff = _setting(backoff, "RETRY_BACKOFF", 0.3)
+
+        # one keep-alive session, shared by the network worker and the
+        # move listener, so requests reuse open connections
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            # batches are safe to resend, so POST retries too
+            allowed_methods=frozenset({"GET", "PUT", "PATCH", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # the last game fetched and its ETag, for conditional requests
+        self._etag: Optional[str] = None
+        self._game: Optional[dict] = None
+        # the same for get_games, until the API turns out not to batch
+        self.batch = True
+        self._games_etag: Optional[str] = None
+        self._games: dict = {}
+        # the Servers handed out by for_game, by game id
+        self._servers: Dict[str, "Server"] = {}
+
+        self._latency: Dict[str, LatencyStats] = {}
+        self._latency_lock = threading.Lock()
+        # optional histograms of round trips and server processing times
+        self.metrics = metrics
+
+    def _request(self, method: str, endpoint: str, read_timeout=None, **kwargs):
+        # sends a request on the pooled session, timing it per endpoint
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        if self.game_id:
+            kwargs["params"] = {**kwargs.get("params", {}), "id": self.game_id}
+        name = f"{method} /{endpoint}"
+        start = perf_counter()
+        ok = False
+        res = None
+        try:
+            res = self.session.request(
+                method, self.HOST + endpoint, timeout=timeout, **kwargs
+            )
+            ok = res.status_code < 500
+            return res
+        finally:
+            elapsed = perf_counter() - start
+            with self._latency_lock:
+                stats = self._latency.setdefault(name, LatencyStats())
+                stats.record(elapsed, ok)
+            if self.metrics is not None:
+                self.metrics.observe(f"http {name}", elapsed)
+                server_time = _server_time(res)
+                if server_time is not None:
+                    self.metrics.observe(f"server {name}", server_time)
+
+    def get_latency_stats(self) -> dict:
+        # {"GET /game": {"count": ..., "mean_ms": ..., ...}, ...}
+        with self._latency_lock:
+            return {name: s.as_dict() for name, s in self._latency.items()}
 
     def get_root(self) -> dict:
-        res: requests.Response = requests.get(self.HOST)
+        res: requests.Response = self._request("GET", "")
         return res.json()
 
     def make_move(self, turn, move, timestamp) -> None:
+        # one move as a 14 byte batch if the API takes them, else as a PATCH
+        if self.compact and self.send_moves(
+            turn, [(move["from"], move["to"])], timestamp
+        ) is not None:
+            return
+
         params = {
             "turn": turn,
             "from": move["from"],
@@ -22,13 +148,511 @@ class Server:
             "time": timestamp,
         }
 
-        requests.patch(self.HOST + "game", params=params)
+        res: requests.Response = self._request("PATCH", "game", params=params)
+        res.raise_for_status()
+
+    def send_moves(self, first_turn, moves, timestamp) -> Optional[dict]:
+        # several moves in one request, ex. to replay or import a game.
+        # first_turn is the turn count after the first move. Returns the
+        # game, or None if the API has no batch endpoint
+        res: requests.Response = self._request(
+            "POST",
+            "game/moves",
+            data=encode_batch(first_turn, moves, timestamp),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+        if res.status_code in (404, 405, 415):
+            self.compact = False
+            return None
+        res.raise_for_status()
+        return json.loads(res.text)
 
     def reset(self) -> dict:
         # used to reset to a new game
-        res: requests.Response = requests.put(self.HOST + "game")
+        res: requests.Response = self._request("PUT", "game")
         return json.loads(res.text)
 
-    def get_game(self) -> dict:
-        res: requests.Response = requests.get(self.HOST + "game")
+    def get_game(self, if_changed=False) -> Optional[dict]:
+        # sends the ETag of the last game seen, so an unchanged game costs
+        # only a 304 with no body to download or parse. With if_changed,
+        # an unchanged game returns None instead of the cached copy.
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        res: requests.Response = self._request("GET", "game", headers=headers)
+        if res.status_code == 304:
+            return None if if_changed else dict(self._game)  # type: ignore
+        game = json.loads(res.text)
+        self._etag = res.headers.get("ETag")
+        self._game = game
+        return game
+
+    def for_game(self, game_id: str) -> "Server":
+        # a Server for another game on the same API. It shares this one's
+        # connection pool, latency stats and metrics. There is one per
+        # game id, so its ETag is kept from call to call
+        other = self._servers.get(game_id)
+        if other is None:
+            other = copy.copy(self)
+            other.game_id = game_id
+            other._etag = None
+            other._game = None
+            other._servers = {}
+            self._servers[game_id] = other
+        return other
+
+    def get_games(self, ids: List[str], if_changed=False) -> Optional[dict]:
+        # the state of several games in one request: {game_id: state}.
+        # Like get_game, an unchanged set of games costs only a 304, and
+        # returns None with if_changed. APIs without /games are asked for
+        # each game in turn, still from this one call; with if_changed,
+        # games that haven't changed are left out
+        if self.batch:
+            headers = {"If-None-Match": self._games_etag} \
+                if self._games_etag else {}
+            res: requests.Response = self._request(
+                "GET", "games", params={"ids": ",".join(ids)}, headers=headers
+            )
+            if res.status_code == 304:
+                return None if if_changed else dict(self._games)
+            if res.status_code not in (404, 405):
+                res.raise_for_status()
+                self._games = json.loads(res.text)["games"]
+                self._games_etag = res.headers.get("ETag")
+                return self._games
+            self.batch = False
+        games = {}
+        for game_id in ids:
+            game = self.for_game(game_id).get_game(if_changed=if_changed)
+            if game is not None:
+                games[game_id] = game
+        return None if if_changed and not games else games
+
+    def get_moves(self, since=0) -> Optional[dict]:
+        # every move after turn `since` in one request, for catching up.
+        # Returns {"turn", "time", "created", "moves": [...]}, or None if
+        # the API has no history endpoint.
+        res: requests.Response = self._request(
+            "GET", "game/moves", params={"since": since}
+        )
+        if res.status_code in (404, 405):
+            return None
+        res.raise_for_status()
         return json.loads(res.text)
+
+    def wait_for_move(self, turn, timestamp, timeout=25.0) -> Optional[dict]:
+        # long-poll: the API holds the request open until the game differs
+        # from (turn, timestamp) or the timeout passes.
+        # Returns None if the API has no push endpoint.
+        params = {"turn": turn, "time": timestamp, "timeout": timeout}
+        res: requests.Response = self._request(
+            "GET", "game/wait", read_timeout=timeout + self.read_timeout,
+            params=params,
+        )
+        if res.status_code in (404, 405):
+            return None
+        res.raise_for_status()
+        return json.loads(res.text)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _server_time(res: Optional[requests.Response]) -> Optional[float]:
+    # the API's own processing time from a "Server-Timing: app;dur=1.5"
+    # header, in seconds, so round trips can be split into server and network
+    if res is None:
+        return None
+    for metric in res.headers.get("Server-Timing", "").split(","):
+        name, _, params = metric.strip().partition(";")
+        if name == "app" and params.startswith("dur="):
+            try:
+                return float(params[4:]) / 1000
+            except ValueError:
+                return None
+    return None
+
+
+def _setting(value, name: str, default: float) -> float:
+    # an explicit argument wins, then the environment, then the default
+    if value is not None:
+        return value
+    return float(getenv(name, default))
+
+
+class Outbox:
+    """
+    A persistent, in-order queue of moves waiting to reach the API. Moves
+    are played locally at once and queued here; flush() sends them from the
+    network worker. The queue is saved to disk on every change, so moves
+    made offline survive a restart.
+    """
+
+    def __init__(self, path=".move_outbox") -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        # each entry is {"turn", "from", "to", "time"}, oldest first
+        self._moves: List[dict] = []
+        # check the API's game before the next send, ex. after a failure
+        self._reconcile = False
+        self._retry_at = 0.0
+        self._backoff = 1.0
+        try:
+            with open(path) as file:
+                self._moves = json.load(file)
+            self._reconcile = bool(self._moves)
+        except (OSError, ValueError):
+            pass
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._moves)
+
+    def put(self, turn, move, timestamp) -> None:
+        # turn is the turn count after the move, as for Server.make_move
+        with self._lock:
+            self._moves.append(
+                {"turn": turn, "from": move["from"], "to": move["to"],
+                 "time": timestamp}
+            )
+            self._save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._moves = []
+            self._reconcile = False
+            self._save()
+
+    def last_turn(self) -> int:
+        # the turn of the newest queued move, or 0 if nothing is queued
+        with self._lock:
+            return self._moves[-1]["turn"] if self._moves else 0
+
+    def due(self, now: float) -> bool:
+        # whether queued moves are waiting and a retry is allowed
+        with self._lock:
+            return bool(self._moves) and now >= self._retry_at
+
+    def next_retry(self) -> Optional[float]:
+        # the monotonic() time queued moves may next be sent, or None if
+        # nothing is queued
+        with self._lock:
+            return self._retry_at if self._moves else None
+
+    def _save(self) -> None:
+        # callers hold the lock. Written then renamed, so a crash mid-write
+        # never leaves a corrupt queue
+        temp = self.path + ".tmp"
+        with open(temp, "w") as file:
+            json.dump(self._moves, file)
+        replace(temp, self.path)
+
+    def flush(self, server: Server) -> dict:
+        # sends every queued move in order. Runs on the network worker.
+        # Returns {"sent", "pending", "conflict", "diverged"}; a conflict
+        # means the API kept other moves than ours, so those moves are dropped
+        # and the local game must be taken back to turn "diverged", the last
+        # one both agree on, and rebuilt
+        with self._lock:
+            moves = list(self._moves)
+            reconcile = self._reconcile
+        result = {"sent": 0, "pending": len(moves), "conflict": False,
+                  "diverged": None}
+        if not moves:
+            return result
+
+        try:
+            if reconcile:
+                copied = moves
+                moves, diverged = self._settle(server, moves)
+                if diverged is not None:
+                    self._refuse(copied)
+                    result.update(pending=len(self), conflict=True,
+                                  diverged=diverged)
+                    return result
+                self._drop([m for m in copied if m not in moves])
+
+            if moves:
+                start = perf_counter()
+                self._send(server, moves)
+                self._drop(moves)
+                result["sent"] = len(moves)
+                if server.metrics is not None:
+                    _record_acks(server.metrics, moves, perf_counter() - start)
+        except requests.HTTPError as error:
+            if error.response is not None and \
+                    error.response.status_code == 409:
+                # the API refused our moves as out of turn: it has others
+                self._refuse(moves)
+                result.update(pending=len(self), conflict=True,
+                              diverged=moves[0]["turn"] - 1)
+                return result
+            self._failed()
+        except (requests.RequestException, ValueError):
+            self._failed()
+        except Exception:
+            # ex. a malformed response. Still back off, so the game loop
+            # doesn't resend at once, and let the worker report the error
+            self._failed()
+            raise
+        else:
+            with self._lock:
+                self._reconcile = False
+                self._backoff = 1.0
+
+        result["pending"] = len(self)
+        return result
+
+    @staticmethod
+    def _send(server: Server, moves: List[dict]) -> None:
+        # one batch if the API takes them, else a PATCH per move
+        if server.compact and server.send_moves(
+            moves[0]["turn"],
+            [(m["from"], m["to"]) for m in moves],
+            moves[-1]["time"],
+        ) is not None:
+            return
+        for m in moves:
+            server.make_move(m["turn"], m, m["time"])
+
+    @staticmethod
+    def _settle(server: Server,
+                moves: List[dict]) -> Tuple[List[dict], Optional[int]]:
+        # compares queued moves with the API's game, which may have moved
+        # on while we were offline. Moves the API already has are dropped.
+        # Where the API has another move for the same turn, the earlier
+        # timestamp wins: if the API's is earlier, ours are discarded.
+        # Returns the moves still to send, and on a conflict the last turn
+        # both games agree on (else None)
+        first = moves[0]["turn"]
+        history = server.get_moves(since=first - 1)
+        if history is None:
+            # no history endpoint: only the API's last move is known
+            game = server.get_game()
+            history = dict(game, moves=[game]
+                           if int(game["turn"]) >= first else [])
+        if float(history.get("created", 0)) > moves[0]["time"]:
+            # the game was reset after our moves were made
+            return [], 0
+
+        theirs = {int(m["turn"]): m for m in history["moves"]}
+        api_turn = int(history["turn"])
+        unsent = []
+        for m in moves:
+            other = theirs.get(m["turn"])
+            if other is None:
+                if m["turn"] > api_turn:
+                    unsent.append(m)
+                # else a turn the API has but didn't report: assume ours
+            elif (other["from"], other["to"]) != (m["from"], m["to"]):
+                if float(other["time"]) <= m["time"]:
+                    return [], m["turn"] - 1
+                unsent.append(m)
+        if unsent and unsent[0]["turn"] > api_turn + 1:
+            # the API is missing turns between its game and ours
+            return [], api_turn
+        return unsent, None
+
+    def _drop(self, moves: List[dict]) -> None:
+        # removes the given moves once they are on the API or refused. Moves
+        # are matched by turn and time, not position: the queue may have
+        # been cleared, and new moves queued, while they were being sent
+        sent = {(m["turn"], m["time"]) for m in moves}
+        with self._lock:
+            self._moves = [m for m in self._moves
+                           if (m["turn"], m["time"]) not in sent]
+            self._save()
+
+    def _refuse(self, moves: List[dict]) -> None:
+        # removes moves the API won't take, with any queued after them in
+        # the meantime, which were played on top of them. If the queue was
+        # cleared, ex. by a reset, newer moves belong to another game and
+        # stay
+        refused = {(m["turn"], m["time"]) for m in moves}
+        with self._lock:
+            keys = [(m["turn"], m["time"]) for m in self._moves]
+            found = [i for i, key in enumerate(keys) if key in refused]
+            if found:
+                self._moves = [m for i, m in enumerate(self._moves[:found[-1]])
+                               if keys[i] not in refused]
+            self._save()
+
+    def _failed(self) -> None:
+        # the API is unreachable: check its game before the next try
+        with self._lock:
+            self._reconcile = True
+            self._retry_at = monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, 30.0)
+
+
+def _record_acks(metrics: Metrics, moves: List[dict], rtt: float) -> None:
+    # how long each move took from being played to being on the API
+    acked = time()
+    for m in moves:
+        metrics.observe("ack", acked - m["time"])
+        metrics.event(
+            "ack",
+            turn=m["turn"],
+            rtt_ms=round(1000 * rtt, 2),
+            ack_ms=round(1000 * (acked - m["time"]), 2),
+            batch=len(moves),
+        )
+
+
+class PollSchedule:
+    """
+    Decides when to poll the API for one game if it can't push moves. Polls
+    quickly just after our own move, when a reply is likely soon, then backs
+    off while the opponent thinks, up to a ceiling.
+    """
+
+    def __init__(self, fastest=0.5, slowest=8.0, growth=1.5) -> None:
+        self.fastest = fastest
+        self.slowest = slowest
+        self.growth = growth
+        self.interval = fastest
+        self._next = 0.0
+
+    def due(self, now: float) -> bool:
+        return now >= self._next
+
+    def next_at(self) -> float:
+        # the monotonic() time the next poll is due
+        return self._next
+
+    def polled(self, now: float, changed: bool, our_turn=True) -> None:
+        # an unchanged game stretches the interval. A change that makes it
+        # our move means there is nothing to wait for until we play; any
+        # other change, ex. in a game we only watch, may soon be followed
+        # by another
+        if changed and our_turn:
+            self.interval = self.slowest
+        elif changed:
+            self.interval = self.fastest
+        else:
+            self.interval = min(self.interval * self.growth, self.slowest)
+        self._next = now + self.interval
+
+    def moved(self, now: float) -> None:
+        # our own move: the opponent may reply at any moment
+        self.interval = self.fastest
+        self._next = now + self.fastest
+
+
+class MoveListener(threading.Thread):
+    """
+    Waits on the API's push endpoint in the background and queues every
+    new game state as soon as it arrives. If the API does not support push,
+    or the long-poll fails max_failures times in a row, `supported` becomes
+    False and the caller should fall back to polling.
+    notify, if given, is called from the listener thread after either, so
+    an idle game loop can wake up.
+    """
+
+    def __init__(
+        self,
+        server: Server,
+        turn=-1,
+        timestamp=0.0,
+        notify: Optional[Callable[[], None]] = None,
+        max_failures=5,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.server = server
+        self.notify = notify
+        self.max_failures = max_failures
+        self.states: queue.Queue = queue.Queue()
+        self.supported = True
+        self._turn = turn
+        self._time = timestamp
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        backoff = 1.0
+        failures = 0
+        while not self._stopped.is_set():
+            try:
+                state = self.server.wait_for_move(self._turn, self._time)
+            except (requests.RequestException, ValueError):
+                # the API is down or slow; try again later. If the push
+                # endpoint keeps failing, plain polls may still get through
+                failures += 1
+                if failures >= self.max_failures:
+                    self.supported = False
+                    self._notify()
+                    return
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            failures = 0
+
+            if state is None:
+                self.supported = False
+                self._notify()
+                return
+
+            turn, timestamp = int(state["turn"]), float(state["time"])
+            if (turn, timestamp) != (self._turn, self._time):
+                self._turn, self._time = turn, timestamp
+                self.states.put(state)
+                self._notify()
+
+    def _notify(self) -> None:
+        if self.notify is not None:
+            self.notify()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+class NetworkWorker:
+    """
+    Runs Server calls on a background thread so the game loop never waits
+    on the network. Calls run one at a time in the order submitted, so moves
+    reach the API in the order they were played. Each finished call is
+    queued as (kind, result, error) for the game loop to pick up with poll(),
+    and notify, if given, is called from the worker thread to say so.
+    """
+
+    def __init__(self, notify: Optional[Callable[[], None]] = None) -> None:
+        self.notify = notify
+        self._pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="network"
+        )
+        self.results: queue.Queue = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, kind: Hashable, call: Callable, *args) -> Future:
+        # kind labels the result, ex. "reset", or ("flush", game_id) when
+        # calls for several games share the worker
+        with self._lock:
+            self._pending += 1
+        future = self._pool.submit(call, *args)
+        future.add_done_callback(lambda done: self._finish(kind, done))
+        return future
+
+    def _finish(self, kind: Hashable, future: Future) -> None:
+        error = future.exception()
+        result = None if error else future.result()
+        with self._lock:
+            self._pending -= 1
+        self.results.put((kind, result, error))
+        if self.notify is not None:
+            self.notify()
+
+    def pending(self) -> int:
+        # number of submitted calls that have not finished
+        with self._lock:
+            return self._pending
+
+    def poll(self) -> List[Tuple[Hashable, object, Optional[BaseException]]]:
+        # every result that has arrived since the last poll, oldest first
+        finished = []
+        while True:
+            try:
+                finished.append(self.results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def shutdown(self, wait=True) -> None:
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,121 @@
+"""
+Tests for Outbox.flush against local_server.py, run with
+    python -m unittest test_outbox
+"""
+import os
+import tempfile
+import threading
+import unittest
+from time import time
+
+import requests
+
+from local_server import make_server
+from server import Outbox, Server
+
+
+class HookedServer(Server):
+    """A Server that runs a hook once, just before its first batch is sent"""
+    hook = None
+
+    def send_moves(self, first_turn, moves, timestamp):
+        hook, self.hook = self.hook, None
+        if hook is not None:
+            hook()
+        return super().send_moves(first_turn, moves, timestamp)
+
+
+class OutboxTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.api = make_server(port=0)
+        threading.Thread(target=cls.api.serve_forever, daemon=True).start()
+        cls.host = f"http://127.0.0.1:{cls.api.server_address[1]}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.api.shutdown()
+        cls.api.server_close()
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, ".move_outbox")
+        self.server = HookedServer(retries=0, game_id=self.id())
+        self.server.HOST = self.host
+        self.store = self.api.games.get(self.id())
+
+    def tearDown(self):
+        self.server.close()
+        self.dir.cleanup()
+
+    def test_queued_while_offline(self):
+        outbox = Outbox(self.path)
+        outbox.put(1, {"from": "e2", "to": "e4"}, time())
+        outbox.put(2, {"from": "e7", "to": "e5"}, time())
+        self.server.HOST = "http://127.0.0.1:1/"
+        result = outbox.flush(self.server)
+        self.assertEqual((result["sent"], result["pending"]), (0, 2))
+        self.assertFalse(outbox.due(0.0))
+
+        # the first move got through before the connection dropped
+        self.store.move(1, "e2", "e4", time())
+        # a restart loads the queue, and checks the API before sending
+        outbox = Outbox(self.path)
+        self.server.HOST = self.host
+        result = outbox.flush(self.server)
+        self.assertEqual(result, {"sent": 1, "pending": 0,
+                                  "conflict": False, "diverged": None})
+        self.assertEqual(self.store.get()["turn"], 2)
+
+    def test_conflicting_opponent_move(self):
+        outbox = Outbox(self.path)
+        self.store.move(1, "d2", "d4", time())
+        outbox.put(1, {"from": "e2", "to": "e4"}, time())
+        # played on top of the refused move while it was in flight
+        self.server.hook = lambda: outbox.put(
+            2, {"from": "e7", "to": "e5"}, time())
+        result = outbox.flush(self.server)
+        self.assertEqual(result, {"sent": 0, "pending": 0,
+                                  "conflict": True, "diverged": 0})
+        self.assertEqual(self.store.get()["to"], "d4")
+
+        # the same when the API is checked first, after a restart
+        outbox.put(2, {"from": "e7", "to": "e5"}, time() + 2)
+        outbox = Outbox(self.path)
+        self.store.move(2, "d7", "d5", time() + 1)
+        result = outbox.flush(self.server)
+        self.assertEqual(result, {"sent": 0, "pending": 0,
+                                  "conflict": True, "diverged": 1})
+
+    def test_reset_during_flush(self):
+        outbox = Outbox(self.path)
+        outbox.put(1, {"from": "e2", "to": "e4"}, time())
+        new_move = {"turn": 1, "from": "d2", "to": "d4", "time": time() + 1}
+
+        def reset():
+            outbox.clear()
+            outbox.put(1, new_move, new_move["time"])
+
+        self.server.hook = reset
+        result = outbox.flush(self.server)
+        self.assertEqual((result["sent"], result["pending"]), (1, 1))
+        with outbox._lock:
+            self.assertEqual(outbox._moves, [new_move])
+
+    def test_other_refusals_back_off(self):
+        outbox = Outbox(self.path)
+        outbox.put(1, {"from": "e2", "to": "e4"}, time())
+
+        def refuse():
+            res = requests.Response()
+            res.status_code = 422
+            raise requests.HTTPError(response=res)
+
+        self.server.hook = refuse
+        result = outbox.flush(self.server)
+        self.assertEqual((result["conflict"], result["pending"]), (False, 1))
+        self.assertFalse(outbox.due(0.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
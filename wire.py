@@ -0,0 +1,76 @@
+"""
+The compact wire format for sending moves to the API.
+A move is 16 bits: the origin square (bits 0-5), the destination square
+(bits 6-11) and the promotion piece (bits 12-15, 0 for none), with squares
+numbered 0-63 from a1 to h8.
+A batch is a 12 byte header of the turn after the first move and the time
+of the last, followed by one big-endian 16-bit word per move.
+"""
+import struct
+
+from board import SQUARES
+from pieces import KNIGHT, QUEEN
+
+SQUARE_INDEX = {square: i for i, square in enumerate(SQUARES)}
+CONTENT_TYPE = "application/x-chess-moves"
+_HEADER = struct.Struct(">Id")
+
+
+class WireError(ValueError):
+    """Raised when bytes don't hold a valid move batch"""
+    pass
+
+
+def encode_move(sq_from, sq_to, promotion=None):
+    """
+    packs a move into 16 bits
+    :param sq_from: origination. Ex. 'e7'
+    :param sq_to: destination. Ex. 'e8'
+    :param promotion: optional piece type code to promote to, ex. QUEEN
+    :return: int
+    """
+    code = SQUARE_INDEX[sq_from] | SQUARE_INDEX[sq_to] << 6
+    if promotion is not None:
+        code |= (promotion + 1) << 12
+    return code
+
+
+def decode_move(code):
+    """
+    unpacks a 16-bit move
+    :param code: int from encode_move
+    :return: tuple of origination, destination and promotion type code or
+    None
+    """
+    promotion = (code >> 12) - 1
+    if promotion != -1 and not KNIGHT <= promotion <= QUEEN:
+        raise WireError(f"invalid promotion in move {code:#06x}")
+    return (SQUARES[code & 63], SQUARES[code >> 6 & 63],
+            None if promotion == -1 else promotion)
+
+
+def encode_batch(first_turn, moves, timestamp):
+    """
+    packs a sequence of moves for one request
+    :param first_turn: the turn count after the first move
+    :param moves: list of (sq_from, sq_to) or (sq_from, sq_to, promotion)
+    :param timestamp: the time of the last move
+    :return: bytes
+    """
+    codes = [encode_move(*move) for move in moves]
+    return (_HEADER.pack(first_turn, timestamp)
+            + struct.pack(f">{len(codes)}H", *codes))
+
+
+def decode_batch(data):
+    """
+    unpacks a batch made by encode_batch
+    :param data: bytes
+    :return: tuple of the first turn, a list of decoded moves and the time
+    """
+    if len(data) < _HEADER.size or (len(data) - _HEADER.size) % 2:
+        raise WireError(f"a batch can't be {len(data)} bytes long")
+    first_turn, timestamp = _HEADER.unpack_from(data)
+    count = (len(data) - _HEADER.size) // 2
+    codes = struct.unpack_from(f">{count}H", data, _HEADER.size)
+    return first_turn, [decode_move(code) for code in codes], timestamp
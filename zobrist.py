@@ -0,0 +1,109 @@
+"""
+Zobrist keys for hashing chess positions, and a fixed size transposition
+table keyed on those hashes
+"""
+import random
+
+COLORS = ('W', 'B')
+PIECE_TYPES = ('Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King')
+SQUARES = tuple(f"{f}{r}" for r in '12345678' for f in 'abcdefgh')
+
+# a fixed seed keeps hashes identical across processes and machines
+_rng = random.Random(20220326)
+PIECE_KEYS = {
+    (color, piece_type, square): _rng.getrandbits(64)
+    for color in COLORS
+    for piece_type in PIECE_TYPES
+    for square in SQUARES
+}
+BLACK_TO_MOVE = _rng.getrandbits(64)
+
+
+def piece_key(piece, square):
+    """
+    returns the key for a piece standing on a square
+    :param piece: the piece object
+    :param square: the coordinates of the square. Ex. 'a2'
+    :return: 64-bit int
+    """
+    return PIECE_KEYS[(piece.get_color(), piece.get_piece_type(), square)]
+
+
+class TranspositionTable:
+    """
+    A fixed size hash table keyed on Zobrist hashes. Each hash maps to one
+    slot; a new entry replaces the old one unless the old entry was stored
+    with a greater depth.
+    """
+    def __init__(self, size=1 << 14):
+        """
+        initialize an empty table
+        :param size: number of slots, rounded up to a power of two
+        """
+        slots = 1
+        while slots < size:
+            slots <<= 1
+        self._mask = slots - 1
+        self._slots = [None] * slots
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._replacements = 0
+
+    def __len__(self):
+        """returns the number of occupied slots"""
+        return sum(1 for entry in self._slots if entry is not None)
+
+    def get(self, key):
+        """
+        looks up the value stored for a hash
+        :param key: 64-bit Zobrist hash
+        :return: the stored value, or None on a miss
+        """
+        entry = self._slots[key & self._mask]
+        if entry is not None and entry[0] == key:
+            self._hits += 1
+            return entry[2]
+
+        self._misses += 1
+        return None
+
+    def store(self, key, value, depth=0):
+        """
+        stores a value for a hash, subject to the replacement policy
+        :param key: 64-bit Zobrist hash
+        :param value: anything
+        :param depth: how much work the value represents. Deeper entries
+        are kept over shallower ones from colliding positions
+        :return: bool, whether the value was stored
+        """
+        index = key & self._mask
+        entry = self._slots[index]
+        if entry is not None and entry[0] != key:
+            if entry[1] > depth:
+                return False
+            self._replacements += 1
+
+        self._slots[index] = (key, depth, value)
+        self._stores += 1
+        return True
+
+    def clear(self):
+        """empties the table and resets its counters"""
+        self._slots = [None] * len(self._slots)
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._replacements = 0
+
+    def get_stats(self):
+        """returns a dict of lookup and store counters"""
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._slots),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "stores": self._stores,
+            "replacements": self._replacements,
+        }